@@ -0,0 +1,119 @@
+# aggregates.py
+import os
+import json
+import hashlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+AGG_COLUMNS = ['count', 'quantity_sum', 'unit_price_sum', 'total_amount_sum']
+STATE_FILE = 'sku_state.parquet'
+MANIFEST_KEY = b'sku_state_manifest'
+
+def aggregate_partition(sale_df):
+    grouped = sale_df.groupby('sku', observed=True)
+    delta = pd.DataFrame({
+        'count': grouped['unit_price'].count(),
+        'quantity_sum': grouped['quantity'].sum(),
+        'unit_price_sum': grouped['unit_price'].sum(),
+        'total_amount_sum': grouped['total_amount'].sum(),
+    })
+    delta.index = delta.index.astype(str)
+    delta.index.name = 'sku'
+    return delta
+
+def merge_aggregates(state, delta):
+    # Only the SKUs present in the delta are touched; unseen SKUs are appended
+    if state is None or state.empty:
+        return delta.copy()
+    known = delta.index.isin(state.index)
+    if known.any():
+        state.loc[delta.index[known], AGG_COLUMNS] += delta.loc[known, AGG_COLUMNS]
+    if (~known).any():
+        state = pd.concat([state, delta.loc[~known]])
+    return state
+
+def finalize_aggregates(state):
+    return pd.DataFrame({
+        'sku': state.index,
+        'total_quantity': state['quantity_sum'].to_numpy(),
+        'avg_unit_price': (state['unit_price_sum'] / state['count']).to_numpy(),
+        'total_sales': state['total_amount_sum'].to_numpy(),
+    })
+
+def partition_id(df):
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+    return digest[:16]
+
+def load_state(state_dir):
+    state_path = os.path.join(state_dir, STATE_FILE)
+    if not os.path.exists(state_path):
+        return None, {'base': None, 'partitions': []}
+    table = pq.read_table(state_path)
+    manifest = json.loads(table.schema.metadata[MANIFEST_KEY])
+    return table.to_pandas().set_index('sku'), manifest
+
+def load_manifest(state_dir):
+    # Just the Parquet footer, without reading the sums
+    state_path = os.path.join(state_dir, STATE_FILE)
+    if not os.path.exists(state_path):
+        return {'base': None, 'partitions': []}
+    return json.loads(pq.read_schema(state_path).metadata[MANIFEST_KEY])
+
+def save_state(state_dir, state, manifest):
+    # The manifest rides in the Parquet footer so sums and folded partitions are swapped in together
+    os.makedirs(state_dir, exist_ok=True)
+    state_path = os.path.join(state_dir, STATE_FILE)
+    table = pa.Table.from_pandas(state.reset_index(), preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), MANIFEST_KEY: json.dumps(manifest)})
+    pq.write_table(table, f"{state_path}.tmp")
+    os.replace(f"{state_path}.tmp", state_path)
+
+def list_partitions(partition_dir):
+    if not partition_dir or not os.path.isdir(partition_dir):
+        return []
+    return sorted(name for name in os.listdir(partition_dir) if name.endswith('.parquet'))
+
+def update_state(state_dir, base_df, partition_dir=None):
+    state, manifest = load_state(state_dir)
+    base = partition_id(base_df)
+    changed = manifest['base'] != base
+    if changed:
+        # The base history itself changed, so the running sums are no longer valid
+        if manifest['base'] is None:
+            print("📦 Building SKU aggregate state...")
+        else:
+            print("♻️ Base sales history changed, rebuilding SKU aggregate state...")
+        state = aggregate_partition(base_df)
+        manifest = {'base': base, 'partitions': []}
+
+    state, folded, _ = _fold_new_partitions(state, manifest, partition_dir)
+    print(f"📥 Folded {folded} new partition(s) into state for {len(state):,} SKUs")
+    if changed or folded:
+        save_state(state_dir, state, manifest)
+    return state
+
+def _fold_new_partitions(state, manifest, partition_dir):
+    folded, touched = 0, []
+    for name in list_partitions(partition_dir):
+        if name in manifest['partitions']:
+            continue
+        delta = aggregate_partition(pd.read_parquet(os.path.join(partition_dir, name)))
+        state = merge_aggregates(state, delta)
+        manifest['partitions'].append(name)
+        touched.append(delta.index)
+        folded += 1
+    affected = touched[0].append(touched[1:]).unique() if touched else pd.Index([], name='sku')
+    return state, folded, affected
+
+def fold_partitions(state_dir, partition_dir, save=True):
+    # Folds new partitions into the existing state without re-reading the base history;
+    # returns the state, its manifest and the SKUs whose sums changed
+    state, manifest = load_state(state_dir)
+    if manifest['base'] is None:
+        raise FileNotFoundError(f"No SKU aggregate state in {state_dir}; run the full pipeline first")
+    state, folded, affected = _fold_new_partitions(state, manifest, partition_dir)
+    if save and folded:
+        save_state(state_dir, state, manifest)
+    print(f"📥 Folded {folded} new partition(s) touching {len(affected):,} SKUs")
+    return state, manifest, affected
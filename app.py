@@ -1,15 +1,18 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
-import numpy as np
-import io
+import functools
 import os
-from werkzeug.security import generate_password_hash, check_password_hash
+import time
 from dotenv import load_dotenv
+from db import HISTORY_PAGE_SIZE, init_db, create_user, check_user, save_chat, get_history, failed_chat_writes
+import dashboard_data
+import exports
+import chat_memory
+import response_cache
+from kpis import file_version
+from registry import BEST_MODEL_PATH
 
 # LangChain and Groq imports
 from langchain_groq import ChatGroq
-from langchain.memory import ConversationBufferMemory
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.messages import HumanMessage, AIMessage
@@ -17,6 +20,8 @@ from langchain_core.messages import HumanMessage, AIMessage
 # Load environment variables
 load_dotenv()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+# Replies are rendered token by token unless CHAT_STREAMING=0
+CHAT_STREAMING = os.getenv("CHAT_STREAMING", "1") != "0"
 
 # Professional CSS with animations and modern theme
 st.markdown("""
@@ -373,26 +378,17 @@ header {visibility: hidden;}
 """, unsafe_allow_html=True)
 
 # DB setup
-conn = sqlite3.connect('users.db', check_same_thread=False)
-c = conn.cursor()
-c.execute('''
-CREATE TABLE IF NOT EXISTS users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    username TEXT UNIQUE NOT NULL,
-    password_hash TEXT NOT NULL
-)
-''')
-c.execute('''
-CREATE TABLE IF NOT EXISTS chat_history (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    message TEXT,
-    response TEXT
-)
-''')
-conn.commit()
+@st.cache_resource
+def setup_db():
+    # Schema and migrations run once per server process, not on every rerun
+    init_db()
+
+setup_db()
 
 # LangChain/Groq Setup
+if "groq_chat_model" not in st.session_state and os.getenv("CHAT_MODEL") == "fake":
+    st.session_state.groq_chat_model = chat_memory.fake_chat_model(float(os.getenv("FAKE_CHAT_DELAY", "0.02")))
+
 if "groq_chat_model" not in st.session_state:
     try:
         st.session_state.groq_chat_model = ChatGroq(temperature=0, groq_api_key=GROQ_API_KEY, model_name="llama3-8b-8192")
@@ -401,7 +397,8 @@ if "groq_chat_model" not in st.session_state:
         st.session_state.groq_chat_model = None
 
 if "chat_memory" not in st.session_state:
-    st.session_state.chat_memory = ConversationBufferMemory(return_messages=True)
+    # Recent turns plus a rolling summary under a token budget; CHAT_MEMORY_MODE=buffer keeps everything
+    st.session_state.chat_memory = chat_memory.from_env(st.session_state.groq_chat_model)
 
 # Prompt template for the chatbot
 prompt = ChatPromptTemplate.from_messages(
@@ -418,31 +415,6 @@ prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-# Utils
-def create_user(username, password):
-    password_hash = generate_password_hash(password)
-    try:
-        c.execute('INSERT INTO users (username, password_hash) VALUES (?,?)', (username, password_hash))
-        conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        return False
-
-def check_user(username, password):
-    c.execute('SELECT id, password_hash FROM users WHERE username=?', (username,))
-    user = c.fetchone()
-    if user and check_password_hash(user[1], password):
-        return user[0]
-    return None
-
-def save_chat(user_id, msg, response):
-    c.execute('INSERT INTO chat_history (user_id, message, response) VALUES (?,?,?)', (user_id, msg, response))
-    conn.commit()
-
-def get_history(user_id):
-    c.execute('SELECT message, response FROM chat_history WHERE user_id=?', (user_id,))
-    return c.fetchall()
-
 # Session state initialization
 if 'page' not in st.session_state:
     st.session_state.page = 'login'
@@ -557,6 +529,31 @@ def signup_page():
     st.markdown('</div>', unsafe_allow_html=True)
 
 # Enhanced overview page with professional dashboard
+@st.fragment(run_every=1)
+def job_status():
+    # Polls the job table on its own so the rest of the page isn't rerun every second
+    job_id = st.session_state.get('job_id')
+    if job_id is None:
+        return
+    job = dashboard_data.job_status(job_id)
+    if job is None:
+        st.session_state.job_id = None
+        return
+    label = "Retraining" if job['kind'] == 'pipeline' else "Rescoring"
+    if job['state'] in ('queued', 'running'):
+        st.progress(job['progress'], text=f"{label}: {job['message'] or job['stage'] or ''}")
+        done = [s for s in job['stages'] if s['seconds'] is not None]
+        if done:
+            st.caption(" • ".join(f"{s['name']} {s['seconds']:.1f}s" for s in done))
+    elif job['state'] == 'failed':
+        st.session_state.job_id = None
+        st.error(f"❌ {label} failed: {job['error']}")
+    else:
+        st.session_state.job_id = None
+        dashboard_data.invalidate()
+        st.toast("Predictions refreshed successfully! ✨")
+        st.rerun()
+
 def overview_page():
     show_navbar()
 
@@ -569,28 +566,11 @@ def overview_page():
     </div>
     """, unsafe_allow_html=True)
 
-    # Sample data (since we don't have the actual file)
-    @st.cache_data
-    def load_data():
-        # Generate sample data for demonstration
-        np.random.seed(42)
-        n_products = 100
-
-        skus = [f"SKU-{1000+i}" for i in range(n_products)]
-        quantities = np.random.randint(10, 1000, n_products)
-        prices = np.random.uniform(100, 2000, n_products)
-        sales = quantities * prices
-        costs = prices * np.random.uniform(0.5, 0.8, n_products)
-
-        return pd.DataFrame({
-            'sku': skus,
-            'total_quantity': quantities,
-            'suggested_price': prices,
-            'total_sales': sales,
-            'cost': costs
-        })
-
-    df = load_data()
+    df, version = dashboard_data.get_table()
+    path = dashboard_data.PREDICTIONS_PATH
+    if version is None:
+        st.info("No pipeline output found yet, showing sample data. Run `python flow.py` to generate predictions.")
+    summary = dashboard_data.kpis(path, version)
 
     # Stats cards
     col1, col2, col3, col4 = st.columns(4)
@@ -598,13 +578,13 @@ def overview_page():
     with col1:
         st.markdown(f"""
         <div class="stat-box">
-            <h3 style="color: var(--primary-color); margin: 0;">📦 {len(df):,}</h3>
+            <h3 style="color: var(--primary-color); margin: 0;">📦 {summary['products']:,}</h3>
             <p style="margin: 0.5rem 0 0 0; color: var(--text-secondary);">Total Products</p>
         </div>
         """, unsafe_allow_html=True)
 
     with col2:
-        total_revenue = df['total_sales'].sum()
+        total_revenue = summary['total_revenue']
         st.markdown(f"""
         <div class="stat-box">
             <h3 style="color: var(--accent-color); margin: 0;">💰 ₹{total_revenue:,.0f}</h3>
@@ -613,7 +593,7 @@ def overview_page():
         """, unsafe_allow_html=True)
 
     with col3:
-        avg_price = df['suggested_price'].mean()
+        avg_price = summary['avg_price']
         st.markdown(f"""
         <div class="stat-box">
             <h3 style="color: var(--primary-color); margin: 0;">📈 ₹{avg_price:.0f}</h3>
@@ -622,15 +602,20 @@ def overview_page():
         """, unsafe_allow_html=True)
 
     with col4:
-        df['margin'] = ((df['suggested_price'] - df['cost']) / df['suggested_price'])
-        avg_margin = df['margin'].mean()
+        avg_margin = summary['avg_margin']
+        # The predictions carry no cost, so there is only a margin when the data supplies one
+        margin_label = "n/a" if avg_margin is None else f"{avg_margin:.1%}"
         st.markdown(f"""
         <div class="stat-box">
-            <h3 style="color: var(--accent-color); margin: 0;">📊 {avg_margin:.1%}</h3>
+            <h3 style="color: var(--accent-color); margin: 0;">📊 {margin_label}</h3>
             <p style="margin: 0.5rem 0 0 0; color: var(--text-secondary);">Avg Margin</p>
         </div>
         """, unsafe_allow_html=True)
 
+    if avg_margin is not None:
+        with st.expander("📊 Margin Distribution"):
+            st.bar_chart(dashboard_data.margin_histogram(summary), sort=False)
+
     # Filters section
     st.markdown('<div class="metric-card">', unsafe_allow_html=True)
     st.subheader("🔍 Filters & Controls")
@@ -638,19 +623,27 @@ def overview_page():
     col1, col2 = st.columns(2)
     with col1:
         sku_filter = st.text_input("🔎 Filter SKU contains:", placeholder="Enter SKU to search...", key="sku_filter")
-        if sku_filter:
-            df = df[df['sku'].str.contains(sku_filter, case=False, na=False)]
 
     with col2:
-        margin_range = st.slider("📊 Margin Range", 0.0, 1.0, (0.2, 0.6), format="%.1f", key="margin_range")
-        df = df[(df['margin'] >= margin_range[0]) & (df['margin'] <= margin_range[1])]
+        slider_range = dashboard_data.margin_slider_range(summary)
+        if slider_range is None:
+            margin_range = (None, None)
+            st.slider("📊 Margin Range", 0.0, 1.0, (0.0, 1.0), format="%.1f", disabled=True, key="margin_range",
+                      help="Needs a cost column in the data")
+        else:
+            margin_range = st.slider("📊 Margin Range", *slider_range, slider_range, step=0.1, format="%.1f",
+                                     key=f"margin_range_{slider_range}")
+            # Snapped to one decimal so the ends line up with the summary's bucket edges
+            margin_range = tuple(round(v, 1) for v in margin_range)
+
+    view_args = (path, version, sku_filter, margin_range[0], margin_range[1])
 
     st.markdown('</div>', unsafe_allow_html=True)
 
     # Top products section
     st.markdown('<div class="metric-card">', unsafe_allow_html=True)
     st.subheader("🏆 Top-Selling Products")
-    top10 = df.sort_values('total_quantity', ascending=False).head(10)
+    top10 = dashboard_data.top_n(*view_args, n=10)
 
     # Display as cards instead of table
     for i in range(0, len(top10), 2):
@@ -658,6 +651,7 @@ def overview_page():
         for j, col in enumerate(cols):
             if i + j < len(top10):
                 product = top10.iloc[i + j]
+                margin_text = "" if avg_margin is None else f" | Margin: {product['margin']:.1%}"
                 with col:
                     st.markdown(f"""
                     <div style="background: rgba(255, 255, 255, 0.7);
@@ -665,8 +659,7 @@ def overview_page():
                                 border-left: 4px solid var(--primary-color);">
                         <h4 style="margin: 0 0 0.5rem 0; color: var(--primary-color);">{product['sku']}</h4>
                         <p style="margin: 0; color: var(--text-secondary);">Qty: {product['total_quantity']:,} |
-                        Price: ₹{product['suggested_price']:.0f} |
-                        Margin: {product['margin']:.1%}</p>
+                        Price: ₹{product['suggested_price']:.0f}{margin_text}</p>
                     </div>
                     """, unsafe_allow_html=True)
 
@@ -676,7 +669,21 @@ def overview_page():
     # Charts section
     st.markdown('<div class="metric-card">', unsafe_allow_html=True)
     st.subheader("📈 Price Distribution")
-    st.bar_chart(df.set_index('sku')['suggested_price'].head(20))
+    st.bar_chart(dashboard_data.price_histogram(*view_args), sort=False)
+    st.markdown('</div>', unsafe_allow_html=True)
+
+    # Paginated product table
+    st.markdown('<div class="metric-card">', unsafe_allow_html=True)
+    st.subheader("📋 Products")
+    col1, col2 = st.columns(2)
+    with col2:
+        page_size = st.selectbox("Rows per page", dashboard_data.PAGE_SIZES,
+                                 index=dashboard_data.PAGE_SIZES.index(dashboard_data.PAGE_SIZE), key="page_size")
+    with col1:
+        page_number = st.number_input("Page", min_value=1, value=1, step=1, key="page_number")
+    page_rows, total, pages = dashboard_data.page(*view_args, page_number=page_number, page_size=page_size)
+    st.dataframe(page_rows, hide_index=True, use_container_width=True)
+    st.caption(f"Page {min(page_number, pages)} of {pages} • {total:,} matching products")
     st.markdown('</div>', unsafe_allow_html=True)
 
     # Data upload section
@@ -686,15 +693,25 @@ def overview_page():
 
     col1, col2 = st.columns(2)
     with col1:
-        if st.button("🔄 Refresh Predictions", key="refresh_button"):
-            with st.spinner("Processing..."):
-                import time
-                time.sleep(2)  # Simulate processing
-            st.success("Predictions refreshed successfully! ✨")
-
+        if st.button("🔄 Refresh Predictions", key="refresh_button", disabled=uploaded_file is None):
+            try:
+                job_id = dashboard_data.submit_upload(uploaded_file, st.session_state.get('user_id'))
+                if job_id is None:
+                    st.info("This file was already uploaded.")
+                else:
+                    st.session_state.job_id = job_id
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            except Exception as e:
+                st.error(f"❌ Could not start rescoring: {e}")
     with col2:
-        if uploaded_file:
-            st.success(f"✅ Uploaded: {uploaded_file.name}")
+        # Identical requests from other users join the job already queued or running
+        if st.button("🧠 Retrain Model", key="retrain_button"):
+            try:
+                st.session_state.job_id = dashboard_data.submit_retrain(st.session_state.get('user_id'))
+            except Exception as e:
+                st.error(f"❌ Could not start retraining: {e}")
+    job_status()
 
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -702,29 +719,19 @@ def overview_page():
     st.markdown('<div class="metric-card">', unsafe_allow_html=True)
     st.subheader("⬇ Export Data")
 
-    col1, col2 = st.columns(2)
-    with col1:
-        csv_data = df.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            "📄 Download CSV",
-            csv_data,
-            file_name='suggested_prices.csv',
-            mime='text/csv',
-            use_container_width=True,
-            key="download_csv_button"
-        )
-
-    with col2:
-        excel_buf = io.BytesIO()
-        df.to_excel(excel_buf, index=False)
-        st.download_button(
-            "📊 Download Excel",
-            excel_buf.getvalue(),
-            file_name='suggested_prices.xlsx',
-            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            use_container_width=True,
-            key="download_excel_button"
-        )
+    # Files are only built when a button is clicked, then reused while the filters stay the same
+    for col, (fmt, label) in zip(st.columns(3), [('csv', "📄 Download CSV"), ('excel', "📊 Download Excel"),
+                                                 ('parquet', "⚡ Download Parquet")]):
+        ext, mime = exports.FORMATS[fmt]
+        with col:
+            st.download_button(
+                label,
+                functools.partial(dashboard_data.export, *view_args, fmt=fmt),
+                file_name=f'suggested_prices.{ext}',
+                mime=mime,
+                use_container_width=True,
+                key=f"download_{fmt}_button"
+            )
 
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -737,6 +744,33 @@ def overview_page():
     """, unsafe_allow_html=True)
 
 # Enhanced chatbot page
+@st.cache_resource
+def chat_cache():
+    # CHAT_CACHE_SIMILARITY=1 also reuses answers to near-duplicate questions
+    embed = response_cache.hashing_embedding if os.getenv("CHAT_CACHE_SIMILARITY") == "1" else None
+    return response_cache.ResponseCache(ttl_s=float(os.getenv("CHAT_CACHE_TTL_S", response_cache.CACHE_TTL_S)),
+                                        embed=embed)
+
+def chat_cache_version():
+    # A new predictions file, best model or chat model makes every cached answer stale
+    model = getattr(st.session_state.groq_chat_model, 'model_name', type(st.session_state.groq_chat_model).__name__)
+    return response_cache.version_key(dashboard_data.data_version(), file_version(BEST_MODEL_PATH), model)
+
+def render_message(role, content, container=None):
+    container = container or st
+    if role == 'user':
+        container.markdown(f"""
+        <div class="chat-message">
+            <strong style="color: var(--primary-color);">You:</strong> {content}
+        </div>
+        """, unsafe_allow_html=True)
+    else:
+        container.markdown(f"""
+        <div class="chat-message" style="border-left-color: var(--accent-color);">
+            <strong style="color: var(--accent-color);">AI Assistant:</strong> {content}
+        </div>
+        """, unsafe_allow_html=True)
+
 def chatbot_page():
     show_navbar()
 
@@ -748,44 +782,80 @@ def chatbot_page():
     """, unsafe_allow_html=True)
 
     # Display chat history from session state
-    for msg in st.session_state.chat_memory.buffer:
+    for msg in st.session_state.chat_memory.transcript:
         if isinstance(msg, HumanMessage):
-            st.markdown(f"""
-            <div class="chat-message">
-                <strong style="color: var(--primary-color);">You:</strong> {msg.content}
-            </div>
-            """, unsafe_allow_html=True)
+            render_message('user', msg.content)
         elif isinstance(msg, AIMessage):
-            st.markdown(f"""
-            <div class="chat-message" style="border-left-color: var(--accent-color);">
-                <strong style="color: var(--accent-color);">AI Assistant:</strong> {msg.content}
-            </div>
-            """, unsafe_allow_html=True)
+            render_message('ai', msg.content)
+
+    calls = st.session_state.chat_memory.calls
+    cache_stats = chat_cache().stats()
+    if calls or cache_stats['lookups']:
+        with st.expander("📏 Prompt size & latency"):
+            if calls:
+                last = calls[-1]
+                col1, col2, col3, col4 = st.columns(4)
+                col1.metric("Last prompt tokens", f"{last['prompt_tokens']:,}")
+                col2.metric("Last first token", "–" if last['ttft_s'] is None else f"{last['ttft_s']:.2f}s")
+                col3.metric("Last latency", f"{last['latency_s']:.2f}s")
+                col4.metric("Avg latency", f"{sum(c['latency_s'] for c in calls) / len(calls):.2f}s")
+                st.line_chart({'prompt tokens': [c['prompt_tokens'] for c in calls]})
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Cache hit rate", f"{cache_stats['hit_rate']:.0%}",
+                        help=f"{cache_stats['hits']:,} of {cache_stats['lookups']:,} questions")
+            col2.metric("Latency saved", f"{cache_stats['saved_s']:.1f}s")
+            col3.metric("Cached answers", f"{cache_stats['entries']:,}")
 
     # Chat input
     user_input = st.chat_input("💬 Your message:", key="chat_input")
 
     if user_input:
         if st.session_state.groq_chat_model:
-            with st.spinner("Thinking..."):
-                # Append user message to memory
-                st.session_state.chat_memory.chat_memory.add_user_message(user_input)
-
-                # Create the chain
-                chain = prompt | st.session_state.groq_chat_model
-
-                # Invoke the model
-                response = chain.invoke({
-                    "input": user_input,
-                    "history": st.session_state.chat_memory.buffer
-                }).content
-
-                # Append AI response to memory
-                st.session_state.chat_memory.chat_memory.add_ai_message(response)
-
-                # Save to database
-                save_chat(st.session_state.user_id, user_input, response)
-
+            memory = st.session_state.chat_memory
+            # Create the chain
+            chain = prompt | st.session_state.groq_chat_model
+            # The new message goes in as input; history is the bounded memory
+            inputs = {"input": user_input, "history": memory.prompt_messages()}
+            cache_version = chat_cache_version()
+            # Only an opening question is answered from the shared cache: with history in the prompt the
+            # answer depends on this user's conversation, which the cache key does not cover
+            standalone = not inputs['history']
+            cached = chat_cache().get(user_input, cache_version) if standalone else None
+
+            if cached is not None:
+                # Answered before for the same data and model: no model call at all
+                reply = AIMessage(content=cached[0])
+                if CHAT_STREAMING:
+                    render_message('user', user_input)
+                    render_message('ai', reply.content)
+            elif CHAT_STREAMING:
+                # Only the new turn is drawn: the question now, the answer token by token into one placeholder
+                render_message('user', user_input)
+                placeholder = st.empty()
+                reply, ttft, latency = chat_memory.stream_reply(
+                    chain, inputs, on_text=lambda text: render_message('ai', text + " ▌", placeholder))
+                render_message('ai', reply.content, placeholder)
+            else:
+                with st.spinner("Thinking..."):
+                    start = time.perf_counter()
+                    reply = chain.invoke(inputs)
+                    ttft, latency = None, time.perf_counter() - start
+            response = reply.content
+            if cached is None:
+                tokens, estimated = chat_memory.prompt_tokens(reply, prompt.format_messages(**inputs))
+                memory.record_call(tokens, latency, estimated, ttft)
+                if standalone:
+                    chat_cache().put(user_input, cache_version, response, latency)
+
+            # Append both sides of the turn to memory
+            memory.add_user_message(user_input)
+            memory.add_ai_message(response)
+
+            # Queued for the background chat writer, so the database never holds up the reply
+            save_chat(st.session_state.user_id, user_input, response)
+            st.session_state.pop('history_rows', None)
+
+            if not CHAT_STREAMING:
                 # Rerun to display updated chat history
                 st.rerun()
         else:
@@ -802,18 +872,31 @@ def history_page():
     </div>
     """, unsafe_allow_html=True)
 
-    history = get_history(st.session_state.user_id)
+    # Pages already loaded stay in the session; "Load older" fetches the next page past the last row
+    if 'history_rows' not in st.session_state:
+        st.session_state.history_rows = get_history(st.session_state.user_id)
+        st.session_state.history_more = len(st.session_state.history_rows) == HISTORY_PAGE_SIZE
+    failed = failed_chat_writes(st.session_state.user_id)
+    if failed:
+        st.error(f"❌ {failed} recent message(s) could not be saved to your history")
+    history = st.session_state.history_rows
 
     if history:
-        for i, (message, response) in enumerate(reversed(history)):
+        for i, (message, response, _, _) in enumerate(history):
+            delay = (i % HISTORY_PAGE_SIZE) * 0.1
             st.markdown(f"""
-            <div class="chat-message" style="animation-delay: {i * 0.1}s;">
+            <div class="chat-message" style="animation-delay: {delay}s;">
                 <strong style="color: var(--primary-color);">You:</strong> {message}
             </div>
-            <div class="chat-message" style="border-left-color: var(--accent-color); animation-delay: {i * 0.1 + 0.05}s;">
+            <div class="chat-message" style="border-left-color: var(--accent-color); animation-delay: {delay + 0.05}s;">
                 <strong style="color: var(--accent-color);">AI Assistant:</strong> {response}
             </div>
             """, unsafe_allow_html=True)
+        if st.session_state.history_more and st.button("⬇️ Load older", key="load_older_history"):
+            older = get_history(st.session_state.user_id, before=history[-1][2:])
+            st.session_state.history_rows = history + older
+            st.session_state.history_more = len(older) == HISTORY_PAGE_SIZE
+            st.rerun()
     else:
         st.markdown("""
         <div class="metric-card" style="text-align: center;">
@@ -831,6 +914,7 @@ def logout_page():
     st.session_state.user_id = None
     st.session_state.page = 'login'
     st.session_state.chat_memory.clear()  # Clear chat memory on logout
+    st.session_state.pop('history_rows', None)
     st.rerun()
 
 # Enhanced router with page transitions
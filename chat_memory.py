@@ -0,0 +1,137 @@
+# chat_memory.py
+import os
+import time
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+
+MEMORY_MODES = ('window', 'buffer')
+DEFAULT_MAX_TOKENS = 1500
+DEFAULT_SUMMARY_TOKENS = 300
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and a pricing dashboard assistant.
+Keep figures, SKUs and decisions; drop small talk. Answer with the new summary only, in at most {words} words.
+
+Current summary:
+{summary}
+
+New lines:
+{lines}"""
+
+FAKE_RESPONSES = [
+    "Average suggested prices sit a little above realised sales, so most SKUs show a positive margin.",
+    "Top sellers by quantity are listed on the overview page; filter by SKU to drill into one.",
+    "Margins between 20% and 60% cover the bulk of the catalogue in the latest predictions.",
+]
+
+def estimate_tokens(text):
+    # Roughly 4 characters per token for English; close enough to budget with, and free to compute
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def message_tokens(messages):
+    return sum(estimate_tokens(m.content) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+class TokenBudgetMemory:
+    # Recent turns verbatim plus a rolling summary of everything older, kept under max_tokens.
+    # With max_tokens=None it behaves like an unbounded buffer.
+    def __init__(self, llm=None, max_tokens=DEFAULT_MAX_TOKENS, summary_tokens=DEFAULT_SUMMARY_TOKENS):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.transcript = []
+        self.window = []
+        self.summary = ''
+        self.calls = []
+
+    def add_user_message(self, text):
+        self._add(HumanMessage(content=text))
+
+    def add_ai_message(self, text):
+        self._add(AIMessage(content=text))
+        self._trim()
+
+    def _add(self, message):
+        self.transcript.append(message)
+        self.window.append(message)
+
+    def prompt_messages(self):
+        if not self.summary:
+            return list(self.window)
+        return [SystemMessage(content=f"Summary of the earlier conversation: {self.summary}")] + self.window
+
+    def _trim(self):
+        if self.max_tokens is None:
+            return
+        evicted = []
+        # Whole turns leave the window oldest first, keeping room for the summary; the latest turn always stays
+        while len(self.window) > 2:
+            reserve = self.summary_tokens if self.summary or evicted else 0
+            if message_tokens(self.window) + reserve <= self.max_tokens:
+                break
+            evicted += self.window[:2]
+            self.window = self.window[2:]
+        if evicted:
+            self.summary = self._summarize(self.summary, evicted)
+            print(f"🧠 Folded {len(evicted) // 2} turn(s) into the summary; "
+                  f"window holds {len(self.window) // 2} turn(s), ~{message_tokens(self.prompt_messages())} tokens")
+
+    def _summarize(self, summary, messages):
+        lines = '\n'.join(f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}" for m in messages)
+        if self.llm is not None:
+            try:
+                words = self.summary_tokens * 3 // 4
+                reply = self.llm.invoke(SUMMARY_PROMPT.format(words=words, summary=summary or '(none)', lines=lines))
+                return self._clip(reply.content.strip())
+            except Exception as e:
+                print(f"⚠️ Summarizing with the model failed, keeping a truncated transcript instead: {e}")
+        return self._clip(f"{summary}\n{lines}".strip())
+
+    def _clip(self, text):
+        # Keeps the newest part of an over-long summary
+        limit = self.summary_tokens * CHARS_PER_TOKEN
+        return text if len(text) <= limit else '…' + text[-limit:]
+
+    def record_call(self, prompt_tokens, latency_s, estimated=False, ttft_s=None):
+        self.calls.append({'prompt_tokens': int(prompt_tokens), 'latency_s': latency_s, 'estimated': estimated,
+                           'ttft_s': ttft_s})
+        ttft = f", first token after {ttft_s:.2f}s" if ttft_s is not None else ''
+        print(f"⏱️ LLM call: {prompt_tokens} prompt tokens{' (estimated)' if estimated else ''}, {latency_s:.2f}s{ttft}")
+
+    def clear(self):
+        self.transcript, self.window, self.summary, self.calls = [], [], '', []
+
+def prompt_tokens(response, messages):
+    # Prefers the provider's own count; falls back to the estimate when the response has none
+    usage = getattr(response, 'usage_metadata', None) or {}
+    if usage.get('input_tokens'):
+        return usage['input_tokens'], False
+    return message_tokens(messages), True
+
+def from_env(llm=None):
+    mode = os.getenv('CHAT_MEMORY_MODE', 'window')
+    if mode not in MEMORY_MODES:
+        raise ValueError(f"Unknown CHAT_MEMORY_MODE: {mode}")
+    if mode == 'buffer':
+        return TokenBudgetMemory(llm, max_tokens=None)
+    return TokenBudgetMemory(llm, max_tokens=int(os.getenv('CHAT_MEMORY_TOKENS', DEFAULT_MAX_TOKENS)),
+                             summary_tokens=int(os.getenv('CHAT_SUMMARY_TOKENS', DEFAULT_SUMMARY_TOKENS)))
+
+def stream_reply(chain, inputs, on_text=None):
+    # Streams the reply, calling on_text with the text so far after each chunk.
+    # Returns the merged message (content plus any usage metadata), time to first token and total latency
+    start = time.perf_counter()
+    ttft, message = None, None
+    for chunk in chain.stream(inputs):
+        message = chunk if message is None else message + chunk
+        if ttft is None and chunk.content:
+            ttft = time.perf_counter() - start
+        if on_text and chunk.content:
+            on_text(message.content)
+    if message is None:
+        message = AIMessage(content='')
+    return message, ttft, time.perf_counter() - start
+
+def fake_chat_model(delay=0.02):
+    # Local stand-in for Groq that streams character by character, for exercising the UI and timings offline
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    return FakeListChatModel(responses=FAKE_RESPONSES, sleep=delay)
@@ -0,0 +1,153 @@
+# compile_model.py
+import json
+import numpy as np
+from sklearn.linear_model import LinearRegression
+from sklearn.ensemble import RandomForestRegressor
+from xgboost import XGBRegressor
+
+COMPILED_MODEL_PATH = 'models/best_model.npz'
+PARITY_RTOL = 1e-5
+
+# Tree ensembles flattened into NumPy node arrays and evaluated for all trees at once
+class CompiledModel:
+    def __init__(self, kind, **arrays):
+        self.kind = kind
+        self.arrays = arrays
+
+    def predict(self, X, chunk_size=8192):
+        X = np.asarray(X, dtype='float64')
+        if self.kind == 'linear':
+            return X @ self.arrays['coef'] + self.arrays['intercept']
+        out = np.empty(len(X))
+        for start in range(0, len(X), chunk_size):
+            out[start:start + chunk_size] = self._predict_trees(X[start:start + chunk_size])
+        return out
+
+    def _predict_trees(self, X):
+        a = self.arrays
+        if self.kind == 'xgboost':
+            # XGBoost compares float32 features against float32 split values with a strict <
+            X = X.astype('float32')
+        else:
+            # sklearn casts features to float32 before comparing against float64 thresholds
+            X = X.astype('float32').astype('float64')
+        rows = np.arange(len(X))[None, :]
+        nodes = np.repeat(a['roots'][:, None], len(X), axis=1)
+        for _ in range(int(a['max_depth'])):
+            x = X[rows, a['feature'][nodes]]
+            threshold = a['threshold'][nodes]
+            go_left = x < threshold if self.kind == 'xgboost' else x <= threshold
+            go_left = np.where(np.isnan(x), a['default_left'][nodes], go_left)
+            # Leaves point at themselves, so finished paths simply stay put
+            nodes = np.where(go_left, a['left'][nodes], a['right'][nodes])
+        leaves = a['value'][nodes]
+        if self.kind == 'forest':
+            return leaves.sum(axis=0) / len(a['roots'])
+        # XGBoost starts from base_score and adds each tree in float32, in order
+        margin = np.full((1, len(X)), a['base_score'], dtype='float32')
+        return np.concatenate([margin, leaves.astype('float32')]).sum(axis=0, dtype='float32')
+
+    def save(self, path=COMPILED_MODEL_PATH):
+        np.savez(path, kind=np.array(self.kind), **self.arrays)
+
+    @classmethod
+    def load(cls, path=COMPILED_MODEL_PATH):
+        with np.load(path) as data:
+            arrays = {k: data[k] for k in data.files if k != 'kind'}
+            return cls(str(data['kind']), **arrays)
+
+def _flatten(trees, kind):
+    # trees: (left, right, feature, threshold, value, default_left) per tree, with -1 children at leaves
+    left, right, feature, threshold, value, default_left, roots = [], [], [], [], [], [], []
+    offset, max_depth = 0, 0
+    for l, r, f, t, v, d in trees:
+        n = len(l)
+        ids = np.arange(n) + offset
+        is_leaf = l < 0
+        left.append(np.where(is_leaf, ids, l + offset))
+        right.append(np.where(is_leaf, ids, r + offset))
+        feature.append(np.where(is_leaf, 0, f))
+        threshold.append(t)
+        value.append(np.where(is_leaf, v, 0.0))
+        default_left.append(d)
+        roots.append(offset)
+        max_depth = max(max_depth, _depth(l, r))
+        offset += n
+    return CompiledModel(
+        kind,
+        left=np.concatenate(left).astype('int32'),
+        right=np.concatenate(right).astype('int32'),
+        feature=np.concatenate(feature).astype('int32'),
+        threshold=np.concatenate(threshold).astype('float32' if kind == 'xgboost' else 'float64'),
+        value=np.concatenate(value).astype('float64'),
+        default_left=np.concatenate(default_left).astype(bool),
+        roots=np.array(roots, dtype='int32'),
+        max_depth=np.array(max_depth),
+    )
+
+def _depth(left, right):
+    depth = np.zeros(len(left), dtype=int)
+    for node in range(len(left)):
+        if left[node] >= 0:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+def _compile_forest(model):
+    trees = []
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        missing_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+        trees.append((tree.children_left, tree.children_right, tree.feature, tree.threshold,
+                      tree.value[:, 0, 0], missing_left))
+    return _flatten(trees, 'forest')
+
+def _compile_xgboost(model):
+    booster = model.get_booster()
+    raw = json.loads(booster.save_raw(raw_format='json'))
+    learner = raw['learner']
+    objective = learner['objective']['name']
+    if objective != 'reg:squarederror':
+        raise ValueError(f"Unsupported XGBoost objective: {objective}")
+    trees = learner['gradient_booster']['model']['trees']
+    # Honour early stopping the same way XGBRegressor.predict does
+    try:
+        trees = trees[:model.best_iteration + 1]
+    except AttributeError:
+        pass
+    flat = []
+    for tree in trees:
+        left = np.array(tree['left_children'])
+        # Leaf weights live in split_conditions for leaf nodes
+        flat.append((left, np.array(tree['right_children']), np.array(tree['split_indices']),
+                     np.array(tree['split_conditions'], dtype='float32'),
+                     np.array(tree['split_conditions'], dtype='float64'), np.array(tree['default_left'])))
+    compiled = _flatten(flat, 'xgboost')
+    base_score = learner['learner_model_param']['base_score'].strip('[]').split(',')[0]
+    compiled.arrays['base_score'] = np.array(float(base_score))
+    return compiled
+
+def compile_model(model):
+    if isinstance(model, LinearRegression):
+        return CompiledModel('linear', coef=np.asarray(model.coef_, dtype='float64'),
+                             intercept=np.array(float(model.intercept_)))
+    if isinstance(model, RandomForestRegressor):
+        return _compile_forest(model)
+    if isinstance(model, XGBRegressor):
+        return _compile_xgboost(model)
+    raise TypeError(f"Don't know how to compile {type(model).__name__}")
+
+def check_parity(model, compiled, X, rtol=PARITY_RTOL):
+    expected = np.asarray(model.predict(X), dtype='float64')
+    actual = compiled.predict(X.to_numpy() if hasattr(X, 'to_numpy') else X)
+    scale = max(float(np.abs(expected).max()), 1.0)
+    max_diff = float(np.abs(expected - actual).max()) if len(expected) else 0.0
+    if max_diff > rtol * scale:
+        raise ValueError(f"Compiled model diverges from the original: max abs diff {max_diff:.6g}")
+    return max_diff
+
+def export_compiled(model, X_holdout, path=COMPILED_MODEL_PATH):
+    compiled = compile_model(model)
+    max_diff = check_parity(model, compiled, X_holdout)
+    compiled.save(path)
+    print(f"🧩 Compiled {type(model).__name__} to {path} (holdout max abs diff {max_diff:.3g})")
+    return compiled
@@ -0,0 +1,182 @@
+# dashboard_data.py
+import json
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import streamlit as st
+from kpis import (PREDICTIONS_PATH, KPI_SUMMARY_PATH, SUMMARY_FORMAT, kpi_columns, add_margin, build_kpi_summary,
+                  file_version)
+from filter_index import SkuFilterIndex
+from topk import top_k, merge_bucket_top_k
+import exports
+from rescore import validate_upload, write_partition, unfolded_partitions
+from jobs import JobRunner
+
+PRICE_BINS = 30
+PAGE_SIZE = 50
+PAGE_SIZES = [25, 50, 100, 250]
+PARTITION_DIR = 'data/partitions'
+
+def data_version(path=PREDICTIONS_PATH):
+    return file_version(path)
+
+def _demo_table():
+    # Sample data for when the pipeline hasn't produced an output yet
+    np.random.seed(42)
+    n_products = 100
+
+    skus = [f"SKU-{1000+i}" for i in range(n_products)]
+    quantities = np.random.randint(10, 1000, n_products)
+    prices = np.random.uniform(100, 2000, n_products)
+    sales = quantities * prices
+    costs = prices * np.random.uniform(0.5, 0.8, n_products)
+
+    return pd.DataFrame({
+        'sku': skus,
+        'total_quantity': quantities,
+        'suggested_price': prices,
+        'total_sales': sales,
+        'cost': costs
+    })
+
+@st.cache_resource(max_entries=2, show_spinner="Loading predictions...")
+def _load_table(path, version):
+    # version is only part of the cache key: a new pipeline output gets a new entry.
+    # The frame is shared by every session, so callers must treat it as read-only.
+    if version is None:
+        df = _demo_table()
+    else:
+        df = pq.read_table(path, columns=kpi_columns(path)).to_pandas()
+    df['sku'] = df['sku'].astype(str)
+    return add_margin(df)
+
+def get_table(path=PREDICTIONS_PATH):
+    version = data_version(path)
+    return _load_table(path, version), version
+
+@st.cache_data(max_entries=4)
+def _read_summary(summary_path, summary_version):
+    with open(summary_path) as f:
+        return json.load(f)
+
+@st.cache_data(max_entries=4)
+def _compute_summary(path, version):
+    return build_kpi_summary(_load_table(path, version))
+
+def kpis(path, version, summary_path=KPI_SUMMARY_PATH):
+    # The pipeline's precomputed summary is used as long as it describes the current predictions file
+    summary_version = file_version(summary_path)
+    if version is not None and summary_version is not None:
+        summary = _read_summary(summary_path, summary_version)
+        if summary.get('source_version') == version and summary.get('format') == SUMMARY_FORMAT:
+            return summary
+    return _compute_summary(path, version)
+
+def margin_histogram(summary):
+    edges, counts = summary['margin_histogram']['edges'], summary['margin_histogram']['counts']
+    labels = []
+    for lo, hi in zip(edges[:-1], edges[1:]):
+        if lo is None:
+            labels.append(f"< {hi:.0%}")
+        elif hi is None:
+            labels.append(f"> {lo:.0%}")
+        else:
+            labels.append(f"{lo:.0%}–{hi:.0%}")
+    return pd.DataFrame({'products': counts}, index=pd.Index(labels, name='margin'))
+
+def margin_slider_range(summary, step=0.1):
+    # The slider spans the margins actually present, widened to whole steps; None without cost data
+    if summary.get('margin_range') is None:
+        return None
+    lo, hi = summary['margin_range']
+    lo, hi = round(float(np.floor(lo / step)) * step, 1), round(float(np.ceil(hi / step)) * step, 1)
+    return lo, max(hi, round(lo + step, 1))
+
+@st.cache_data(max_entries=64)
+def price_histogram(path, version, sku_filter, margin_lo, margin_hi, bins=PRICE_BINS):
+    # Binned here so the browser gets `bins` bars however many SKUs match
+    df = _load_table(path, version)
+    positions = filter_positions(path, version, sku_filter, margin_lo, margin_hi)
+    prices = df['suggested_price'].to_numpy(dtype='float64')[positions]
+    prices = prices[np.isfinite(prices)]
+    if not len(prices):
+        return pd.DataFrame({'products': []}, index=pd.Index([], name='price'))
+    counts, edges = np.histogram(prices, bins=bins)
+    # Enough decimals that neighbouring bins never get the same label
+    width = edges[1] - edges[0]
+    decimals = max(0, int(-np.floor(np.log10(width)))) if width > 0 else 2
+    labels = [f"₹{lo:,.{decimals}f}–{hi:,.{decimals}f}" for lo, hi in zip(edges[:-1], edges[1:])]
+    return pd.DataFrame({'products': counts}, index=pd.Index(labels, name='price'))
+
+@st.cache_resource(max_entries=2, show_spinner="Indexing SKUs...")
+def _filter_index(path, version):
+    df = _load_table(path, version)
+    return SkuFilterIndex(df['sku'], df['margin'])
+
+@st.cache_data(max_entries=64)
+def filter_positions(path, version, sku_filter, margin_lo, margin_hi):
+    return _filter_index(path, version).query(sku_filter, margin_lo, margin_hi)
+
+@st.cache_data(max_entries=64)
+def top_n(path, version, sku_filter, margin_lo, margin_hi, n=10, by='total_quantity'):
+    df = _load_table(path, version)
+    candidates = None
+    summary = kpis(path, version)
+    top = summary.get('top_products')
+    # Without a SKU filter the pipeline's lists suffice: the overall one without a margin range,
+    # the per-bucket ones when the slider sits on bucket edges
+    if not sku_filter and top and top['by'] == by and n <= top['k']:
+        if margin_lo is None and margin_hi is None:
+            candidates = np.array(top['all'], dtype='int64')
+        elif margin_lo is not None and margin_hi is not None:
+            candidates = merge_bucket_top_k(top, summary['margin_histogram']['edges'], margin_lo, margin_hi)
+    if candidates is None:
+        candidates = filter_positions(path, version, sku_filter, margin_lo, margin_hi)
+    return df.iloc[top_k(df[by].to_numpy(), n, candidates, df['sku'].to_numpy())]
+
+def rows(path, version, sku_filter, margin_lo, margin_hi, limit=None):
+    df = _load_table(path, version)
+    positions = filter_positions(path, version, sku_filter, margin_lo, margin_hi)
+    return df.iloc[positions if limit is None else positions[:limit]]
+
+def page(path, version, sku_filter, margin_lo, margin_hi, page_number=1, page_size=PAGE_SIZE):
+    # Only the requested page is sliced out and sent; returns (rows, total matches, page count)
+    df = _load_table(path, version)
+    positions = filter_positions(path, version, sku_filter, margin_lo, margin_hi)
+    pages = max(1, -(-len(positions) // page_size))
+    start = (min(max(page_number, 1), pages) - 1) * page_size
+    return df.iloc[positions[start:start + page_size]], len(positions), pages
+
+def export(path, version, sku_filter, margin_lo, margin_hi, fmt='csv'):
+    # Called only when a download button is clicked; the file is reused for the same filters and data
+    key = exports.export_key(version, sku_filter, margin_lo, margin_hi)
+    out = exports.export_file(rows(path, version, sku_filter, margin_lo, margin_hi), fmt, key)
+    with open(out, 'rb') as f:
+        return f.read()
+
+@st.cache_resource
+def job_runner():
+    # Shared by every session, so refreshes from several users queue behind one worker process
+    return JobRunner()
+
+def submit_upload(uploaded_file, user_id=None):
+    # Validation runs inline so a bad file is reported right away; the rescoring itself is queued.
+    # Returns the job id, or None when the same file was already uploaded and rescored
+    path = write_partition(validate_upload(uploaded_file), PARTITION_DIR)
+    if path is None and not unfolded_partitions(PARTITION_DIR):
+        return None
+    job_id, _ = job_runner().submit('rescore', {'partition_dir': PARTITION_DIR}, user_id)
+    return job_id
+
+def submit_retrain(user_id=None):
+    job_id, _ = job_runner().submit('pipeline', {}, user_id)
+    return job_id
+
+def job_status(job_id):
+    return job_runner().status(job_id)
+
+def invalidate():
+    # Entries are keyed on the file version so they'd miss anyway; this frees the old tables now
+    _load_table.clear()
+    _filter_index.clear()
+    st.cache_data.clear()
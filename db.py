@@ -0,0 +1,326 @@
+# db.py
+import os
+import time
+import queue
+import sqlite3
+import contextlib
+import argparse
+import threading
+from werkzeug.security import generate_password_hash, check_password_hash
+
+DB_PATH = 'users.db'
+HISTORY_PAGE_SIZE = 20
+CHAT_BATCH_SIZE = 64
+CHAT_FLUSH_INTERVAL = 0.05
+CHAT_WRITE_RETRIES = 3
+POOL_SIZE = 8
+LOAD_TEST_PASSWORD = 'load-test'
+
+# Fixed statement text, so each connection's statement cache reuses the prepared statements
+INSERT_USER = 'INSERT INTO users (username, password_hash) VALUES (?,?)'
+SELECT_USER = 'SELECT id, password_hash FROM users WHERE username=?'
+INSERT_CHAT = 'INSERT INTO chat_history (user_id, message, response, created_at) VALUES (?,?,?,?)'
+SELECT_HISTORY = ('SELECT message, response, created_at, id FROM chat_history WHERE user_id=? '
+                  'ORDER BY created_at DESC, id DESC LIMIT ?')
+SELECT_HISTORY_BEFORE = ('SELECT message, response, created_at, id FROM chat_history WHERE user_id=? '
+                         'AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?')
+
+_lock = threading.Lock()
+_pools = {}
+_writers = {}
+
+def connect(db_path=DB_PATH):
+    # Pooled connections move between threads, but only one thread uses a connection at a time
+    conn = sqlite3.connect(db_path, timeout=30, cached_statements=64, check_same_thread=False)
+    # WAL lets readers carry on while a write commits; NORMAL skips the fsync per commit that WAL makes safe
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+class ConnectionPool:
+    # Process-wide and bounded: Streamlit runs every rerun on a new thread, so connections are checked out
+    # per call rather than kept per thread, and each stays open with its statement cache between reruns
+    def __init__(self, db_path=DB_PATH, size=POOL_SIZE):
+        self.db_path = db_path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def _checkout(self):
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            create = self.opened < self.size
+            if create:
+                self.opened += 1
+        if not create:
+            # Every connection is in use; wait for one to come back rather than opening more
+            return self.idle.get()
+        try:
+            return connect(self.db_path)
+        except Exception:
+            with self.lock:
+                self.opened -= 1
+            raise
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self._checkout()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self.lock:
+                self.opened -= 1
+
+def get_pool(db_path=DB_PATH):
+    with _lock:
+        if db_path not in _pools:
+            _pools[db_path] = ConnectionPool(db_path)
+        return _pools[db_path]
+
+def get_conn(db_path=DB_PATH):
+    # Use as `with get_conn(db_path) as conn:`; the connection goes back to the pool at the end of the block
+    return get_pool(db_path).connection()
+
+def close_pool(db_path=DB_PATH):
+    with _lock:
+        pool = _pools.pop(db_path, None)
+    if pool is not None:
+        pool.close()
+
+def init_db(db_path=DB_PATH):
+    with get_conn(db_path) as conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL
+        )
+        ''')
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS chat_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            message TEXT,
+            response TEXT,
+            created_at REAL
+        )
+        ''')
+        # Older databases predate created_at; their rows get 0 so they sort before anything timestamped
+        if 'created_at' not in [row[1] for row in conn.execute('PRAGMA table_info(chat_history)')]:
+            conn.execute('ALTER TABLE chat_history ADD COLUMN created_at REAL')
+        conn.execute('UPDATE chat_history SET created_at = 0 WHERE created_at IS NULL')
+        # Serves both the per-user filter and the newest-first keyset pagination
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_chat_history_user_time ON chat_history (user_id, created_at, id)')
+        conn.commit()
+
+def create_user(username, password, db_path=DB_PATH):
+    password_hash = generate_password_hash(password)
+    try:
+        with get_conn(db_path) as conn, conn:
+            conn.execute(INSERT_USER, (username, password_hash))
+        return True
+    except sqlite3.IntegrityError:
+        return False
+
+def check_user(username, password, db_path=DB_PATH):
+    with get_conn(db_path) as conn:
+        user = conn.execute(SELECT_USER, (username,)).fetchone()
+    if user and check_password_hash(user[1], password):
+        return user[0]
+    return None
+
+class ChatWriter:
+    # Chat turns are queued and committed in batches by one thread, so a burst of messages
+    # costs one transaction instead of one commit each. Pending rows are counted per user,
+    # so a history read only waits for that user's own turns.
+    def __init__(self, db_path=DB_PATH, batch_size=CHAT_BATCH_SIZE, flush_interval=CHAT_FLUSH_INTERVAL,
+                 retries=CHAT_WRITE_RETRIES):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.cond = threading.Condition()
+        self.rows = []
+        self.pending = {}
+        self.errors = {}
+        self.urgent = False
+        self.thread = threading.Thread(target=self.run, name='chat-writer', daemon=True)
+        self.thread.start()
+
+    def put(self, user_id, msg, response):
+        with self.cond:
+            self.rows.append((user_id, msg, response, time.time()))
+            self.pending[user_id] = self.pending.get(user_id, 0) + 1
+            self.cond.notify_all()
+
+    def _next_batch(self):
+        with self.cond:
+            self.cond.wait_for(lambda: self.rows)
+            # Wait out the batching window unless the batch is full or a reader is waiting on it
+            deadline = time.monotonic() + self.flush_interval
+            while len(self.rows) < self.batch_size and not self.urgent:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self.cond.wait(timeout)
+            batch, self.rows = self.rows[:self.batch_size], self.rows[self.batch_size:]
+            self.urgent = False
+            return batch
+
+    def _write(self, conn, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                with conn:
+                    conn.executemany(INSERT_CHAT, batch)
+                return None
+            except sqlite3.Error as e:
+                error = e
+                time.sleep(0.1 * 2 ** attempt)
+        return error
+
+    def run(self):
+        conn = connect(self.db_path)
+        while True:
+            batch = self._next_batch()
+            error = self._write(conn, batch)
+            if error is not None:
+                print(f"❌ Failed to save {len(batch)} chat turn(s) after {self.retries + 1} attempts: {error}")
+            with self.cond:
+                for user_id, *_ in batch:
+                    self.pending[user_id] -= 1
+                    if not self.pending[user_id]:
+                        del self.pending[user_id]
+                    if error is not None:
+                        self.errors[user_id] = self.errors.get(user_id, 0) + 1
+                self.cond.notify_all()
+
+    def wait_for(self, user_id):
+        # Blocks until this user's queued turns are committed (or given up on)
+        with self.cond:
+            if user_id in self.pending:
+                self.urgent = True
+                self.cond.notify_all()
+                self.cond.wait_for(lambda: user_id not in self.pending)
+
+    def flush(self):
+        with self.cond:
+            self.urgent = True
+            self.cond.notify_all()
+            self.cond.wait_for(lambda: not self.pending)
+
+    def pop_errors(self, user_id):
+        with self.cond:
+            return self.errors.pop(user_id, 0)
+
+def chat_writer(db_path=DB_PATH):
+    with _lock:
+        if db_path not in _writers:
+            _writers[db_path] = ChatWriter(db_path)
+        return _writers[db_path]
+
+def save_chat(user_id, msg, response, db_path=DB_PATH):
+    chat_writer(db_path).put(user_id, msg, response)
+
+def failed_chat_writes(user_id, db_path=DB_PATH):
+    # Number of this user's turns that could not be saved since the last call
+    return chat_writer(db_path).pop_errors(user_id)
+
+def get_history(user_id, before=None, limit=HISTORY_PAGE_SIZE, db_path=DB_PATH):
+    # Newest first, one page at a time; `before` is the (created_at, id) of the last row already shown.
+    # Waits only for this user's pending turns, so a user always sees their own latest turn
+    if db_path in _writers:
+        _writers[db_path].wait_for(user_id)
+    with get_conn(db_path) as conn:
+        if before is None:
+            return conn.execute(SELECT_HISTORY, (user_id, limit)).fetchall()
+        return conn.execute(SELECT_HISTORY_BEFORE, (user_id, *before, limit)).fetchall()
+
+def _shared_connection_baseline(db_path, sessions, turns):
+    # The old layout: one connection and cursor shared by every thread, committing each chat turn
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    c = conn.cursor()
+    lock = threading.Lock()
+
+    def turn(n, i):
+        with lock:
+            c.execute(SELECT_USER, (f"user{n}",))
+            user = c.fetchone()
+        user_id = user[0] if check_password_hash(user[1], LOAD_TEST_PASSWORD) else None
+        with lock:
+            c.execute(INSERT_CHAT, (user_id, f"question {i}", f"answer {i}", time.time()))
+            conn.commit()
+            c.execute(SELECT_HISTORY, (user_id, HISTORY_PAGE_SIZE))
+            c.fetchall()
+    return turn
+
+def _pooled(db_path, sessions, turns):
+    # Exactly what the app calls per chat turn
+    def turn(n, i):
+        user_id = check_user(f"user{n}", LOAD_TEST_PASSWORD, db_path=db_path)
+        save_chat(user_id, f"question {i}", f"answer {i}", db_path=db_path)
+        get_history(user_id, db_path=db_path)
+    return turn
+
+def _session(turn, n, turns):
+    # Like Streamlit, every turn (rerun) runs on a thread of its own
+    for i in range(turns):
+        t = threading.Thread(target=turn, args=(n, i))
+        t.start()
+        t.join()
+
+def load_test(db_path='loadtest.db', sessions=16, turns=200):
+    # Each simulated session looks up its user, saves a chat turn and reads its latest history page
+    results = {}
+    for name, make_turn in [('shared connection', _shared_connection_baseline), ('pooled + WAL', _pooled)]:
+        for suffix in ('', '-wal', '-shm'):
+            try:
+                os.remove(db_path + suffix)
+            except FileNotFoundError:
+                pass
+        init_db(db_path)
+        with get_conn(db_path) as conn, conn:
+            # A single hash iteration keeps the test about the database rather than password hashing
+            password_hash = generate_password_hash(LOAD_TEST_PASSWORD, method='pbkdf2:sha256:1')
+            conn.executemany(INSERT_USER, [(f"user{i}", password_hash) for i in range(sessions)])
+        close_pool(db_path)
+        turn = make_turn(db_path, sessions, turns)
+        threads = [threading.Thread(target=_session, args=(turn, i, turns)) for i in range(sessions)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+        if db_path in _writers:
+            _writers[db_path].flush()
+        with get_conn(db_path) as conn:
+            saved = conn.execute('SELECT COUNT(*) FROM chat_history').fetchone()[0]
+        close_pool(db_path)
+        results[name] = sessions * turns / elapsed
+        print(f"⏱️ {name}: {sessions} sessions x {turns} turns in {elapsed:.2f}s "
+              f"= {results[name]:,.0f} turns/s ({saved:,} rows saved)")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the chat database with concurrent sessions")
+    parser.add_argument('--db', default='loadtest.db')
+    parser.add_argument('--sessions', type=int, default=16)
+    parser.add_argument('--turns', type=int, default=200)
+    args = parser.parse_args()
+    load_test(args.db, args.sessions, args.turns)
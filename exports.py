@@ -0,0 +1,83 @@
+# exports.py
+import os
+import hashlib
+import tempfile
+import pyarrow as pa
+import pyarrow.parquet as pq
+from openpyxl import Workbook
+
+EXPORT_DIR = 'output/exports'
+MAX_EXPORTS = 20
+CSV_CHUNK_ROWS = 50_000
+FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'excel': ('xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+
+def export_key(version, sku_filter, margin_lo, margin_hi):
+    raw = f"{version}|{sku_filter}|{margin_lo!r}|{margin_hi!r}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:16]
+
+def iter_csv(df, chunk_rows=CSV_CHUNK_ROWS):
+    # Encodes a chunk at a time instead of the whole frame in one string
+    for start in range(0, max(len(df), 1), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=start == 0).encode('utf-8')
+
+def write_csv(df, path):
+    with open(path, 'wb') as f:
+        for chunk in iter_csv(df):
+            f.write(chunk)
+
+def write_excel(df, path):
+    # Write-only workbooks stream rows to disk rather than building every cell in memory
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Sheet1')
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        ws.append(row)
+    wb.save(path)
+
+def write_parquet(df, path):
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path)
+
+WRITERS = {'csv': write_csv, 'excel': write_excel, 'parquet': write_parquet}
+
+def export_file(df, fmt, key, export_dir=EXPORT_DIR):
+    # One file per filter state and format; a repeat download just reuses it
+    ext, _ = FORMATS[fmt]
+    path = os.path.join(export_dir, f"{key}.{ext}")
+    try:
+        os.utime(path)
+        return path
+    except FileNotFoundError:
+        pass
+    os.makedirs(export_dir, exist_ok=True)
+    # Downloads run on worker threads, so two clicks on the same filters each write their own temp file;
+    # whichever finishes last replaces the other's identical file
+    fd, tmp_path = tempfile.mkstemp(dir=export_dir, prefix=f"{key}.", suffix='.tmp')
+    os.close(fd)
+    try:
+        WRITERS[fmt](df, tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    evict(export_dir)
+    return path
+
+def _mtime(path):
+    # Another thread may evict the file between listing and looking at it
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return None
+
+def evict(export_dir=EXPORT_DIR, max_files=MAX_EXPORTS):
+    files = [os.path.join(export_dir, f) for f in os.listdir(export_dir) if not f.endswith('.tmp')]
+    files = sorted((mtime, path) for path, mtime in ((p, _mtime(p)) for p in files) if mtime is not None)
+    for _, path in files[:-max_files]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,95 @@
+# filter_index.py
+import numpy as np
+import pandas as pd
+
+# Queries up to this many bytes are answered straight from the postings; longer ones intersect them
+MAX_GRAM = 3
+ROW_BITS = 31
+
+class SkuFilterIndex:
+    def __init__(self, skus, margins):
+        self.skus = pd.Series(skus, dtype=object).str.lower().to_numpy()
+        self.n = len(self.skus)
+        self._build_grams()
+        margins = np.asarray(margins, dtype='float64')
+        # NaN margins sort to the end and never fall inside a finite range
+        self.margin_order = np.argsort(margins, kind='stable')
+        self.sorted_margins = margins[self.margin_order]
+
+    def _build_grams(self):
+        # Grams are read from one flat byte buffer with row offsets, so memory follows the total SKU length
+        # rather than rows x longest SKU. Each 1..3 byte gram is packed into an int (length tag + bytes) and
+        # combined with its row id, so one sort orders and dedupes the whole inverted index.
+        encoded = [sku.encode('utf-8') for sku in self.skus]
+        lengths = np.fromiter((len(e) for e in encoded), dtype='int64', count=self.n)
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        rows = np.repeat(np.arange(self.n, dtype='int32'), lengths)
+        # Bytes left in the row from each position, so a gram of `size` starts wherever this is >= size
+        remaining = (np.repeat(np.cumsum(lengths), lengths) - np.arange(len(data))).astype('int32')
+        counts = [int(np.count_nonzero(remaining >= size)) for size in range(1, MAX_GRAM + 1)]
+        combined = np.empty(sum(counts), dtype='int64')
+        offset = 0
+        for size, count in zip(range(1, MAX_GRAM + 1), counts):
+            starts = np.flatnonzero(remaining >= size)
+            keys = np.full(count, size << 24, dtype='int64')
+            for i in range(size):
+                keys |= data[starts + i].astype('int64') << (8 * (MAX_GRAM - 1 - i))
+            combined[offset:offset + count] = (keys << ROW_BITS) | rows[starts]
+            offset += count
+        combined.sort()
+        combined = combined[np.append(True, combined[1:] != combined[:-1])] if len(combined) else combined
+        # Postings are stored once per gram: distinct keys plus offsets into one int32 row-id array
+        keys = (combined >> ROW_BITS).astype('int32')
+        boundaries = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+        self.gram_keys = keys[np.append(0, boundaries)] if len(keys) else keys
+        self.gram_offsets = np.concatenate([[0], boundaries, [len(keys)]]).astype('int64')
+        self.postings = (combined & ((1 << ROW_BITS) - 1)).astype('int32')
+
+    @staticmethod
+    def _gram_key(gram):
+        key = len(gram) << 24
+        for i, byte in enumerate(gram):
+            key |= byte << (8 * (MAX_GRAM - 1 - i))
+        return key
+
+    def _posting(self, gram):
+        key = self._gram_key(gram)
+        i = np.searchsorted(self.gram_keys, key)
+        if i == len(self.gram_keys) or self.gram_keys[i] != key:
+            return self.postings[:0]
+        return self.postings[self.gram_offsets[i]:self.gram_offsets[i + 1]]
+
+    def all_rows(self):
+        return np.arange(self.n)
+
+    def contains(self, query):
+        query = query.lower()
+        if not query:
+            return self.all_rows()
+        needle = query.encode('utf-8')
+        if len(needle) <= MAX_GRAM:
+            return self._posting(needle)
+        lists = sorted((self._posting(needle[i:i + MAX_GRAM]) for i in range(len(needle) - MAX_GRAM + 1)), key=len)
+        candidates = lists[0]
+        for posting in lists[1:]:
+            if not len(candidates):
+                break
+            candidates = np.intersect1d(candidates, posting, assume_unique=True)
+        # Sharing every trigram doesn't guarantee a substring match, so confirm the survivors
+        return candidates[[query in sku for sku in self.skus[candidates]]] if len(candidates) else candidates
+
+    def margin_between(self, lo, hi):
+        start = np.searchsorted(self.sorted_margins, lo, side='left')
+        end = np.searchsorted(self.sorted_margins, hi, side='right')
+        return np.sort(self.margin_order[start:end])
+
+    def query(self, sku_filter=None, margin_lo=None, margin_hi=None):
+        # Each filter yields a sorted row-id set; the combined filter is their intersection
+        result = None
+        if margin_lo is not None or margin_hi is not None:
+            result = self.margin_between(-np.inf if margin_lo is None else margin_lo,
+                                         np.inf if margin_hi is None else margin_hi)
+        if sku_filter:
+            matches = self.contains(sku_filter)
+            result = matches if result is None else np.intersect1d(result, matches, assume_unique=True)
+        return self.all_rows() if result is None else result
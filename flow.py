@@ -1,16 +1,93 @@
 # flow.py
+import os
+import glob
+import argparse
 from prefect import flow
-from pipeline import load_and_clean_data, generate_synthetic, feature_engineering, train_and_evaluate, save_predictions
+import ingest
+import aggregates
+import impute
+import tuning
+import compile_model
+import registry
+import jobs
+from impute import IMPUTER_PATH, fit_imputer
+from aggregates import STATE_FILE, list_partitions
+from ingest import dataset_fingerprint
+from price_store import build_price_store
+from kpis import write_kpi_summary
+from stage_cache import StageCache, DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES
+from pipeline import (load_and_clean_data, generate_synthetic, feature_engineering, train_and_evaluate,
+                      save_predictions, stream_predictions)
+
+def _train_outputs():
+    # Every candidate's pickle and the out-of-fold predictions, then the published model itself
+    model_dir = os.path.dirname(registry.BEST_MODEL_PATH)
+    candidates = sorted(glob.glob(os.path.join(model_dir, '*.pkl'))) + [os.path.join(model_dir, 'oof_predictions.parquet')]
+    return list(dict.fromkeys(candidates + registry.best_model_files()))
 
 @flow
-def dynamic_pricing_flow():
-    amazon_df, sale_df = load_and_clean_data()
-    sale_df = generate_synthetic(sale_df)
-    merged_df = feature_engineering(sale_df, amazon_df)
+def dynamic_pricing_flow(data_dir: str = 'data', use_cache: bool = True, refresh: bool = False,
+                         cache_dir: str = DEFAULT_CACHE_DIR, cache_max_bytes: int = DEFAULT_MAX_BYTES,
+                         state_dir: str = 'state', impute_strategy: str = 'mean', n_jobs: int = 1,
+                         tune: bool = False, tune_budget_s: float = 600,
+                         stream_scoring: bool = False, batch_size: int = 65_536,
+                         job_id: int = None, jobs_db: str = jobs.JOBS_DB):
+    # When run as a dashboard job, each stage's start is recorded for progress and timings
+    def stage(name):
+        jobs.track_stage(job_id, name, db_path=jobs_db)
+
+    cache = StageCache(cache_dir, max_bytes=cache_max_bytes, enabled=use_cache)
+    if refresh:
+        cache.clear()
+
+    stage('load')
+    amazon_df, sale_df = cache.run('load', load_and_clean_data, data_dir,
+                                   deps=[ingest], extra_key=dataset_fingerprint(data_dir))
+    stage('synthetic')
+    sale_df = cache.run('synthetic', generate_synthetic, sale_df)
+    stage('features')
+    partition_dir = os.path.join(data_dir, 'partitions')
+    merged_df = cache.run('features', feature_engineering, sale_df, amazon_df, state_dir, partition_dir,
+                          deps=[aggregates], extra_key=list_partitions(partition_dir),
+                          outputs=[os.path.join(state_dir, STATE_FILE)])
+    stage('impute')
+    imputer = cache.run('impute', fit_imputer, merged_df, impute_strategy)
+    imputer.transform(merged_df)
+    os.makedirs(os.path.dirname(IMPUTER_PATH), exist_ok=True)
+    imputer.save(IMPUTER_PATH)
+    stage('train')
     X = merged_df[['total_quantity', 'avg_unit_price']]
     y = merged_df['total_sales']
-    best_model = train_and_evaluate(X, y)
-    save_predictions(merged_df, best_model, ['total_quantity', 'avg_unit_price'])
+    best_model = cache.run('train', train_and_evaluate, X, y, n_jobs=n_jobs, tune=tune, tune_budget_s=tune_budget_s,
+                           deps=[tuning, compile_model, registry], outputs=_train_outputs)
+    stage('score')
+    # Always rewrite the output so a deleted file is never masked by a cache hit
+    if stream_scoring:
+        stream_predictions(merged_df, best_model, ['total_quantity', 'avg_unit_price'],
+                           id_cols=('sku', 'total_sales'), batch_size=batch_size)
+    else:
+        save_predictions(merged_df, best_model, ['total_quantity', 'avg_unit_price'])
+    stage('publish')
+    build_price_store()
+    write_kpi_summary()
 
 if __name__ == "__main__":
-    dynamic_pricing_flow()
+    parser = argparse.ArgumentParser(description="Run the dynamic pricing pipeline")
+    parser.add_argument('--data-dir', default='data')
+    parser.add_argument('--refresh', action='store_true', help="Invalidate the stage cache before running")
+    parser.add_argument('--no-cache', action='store_true', help="Run every stage without reading or writing the cache")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--cache-max-gb', type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3,
+                        help="Evict least recently used stage outputs beyond this size")
+    parser.add_argument('--impute', default='mean', choices=impute.STRATEGIES, help="Missing-value strategy for numeric features")
+    parser.add_argument('--n-jobs', type=int, default=1, help="Worker processes for model training (-1 for all cores)")
+    parser.add_argument('--tune', action='store_true', help="Search RF/XGBoost hyperparameters with successive halving")
+    parser.add_argument('--tune-budget-min', type=float, default=10, help="Wall-clock budget for --tune in minutes")
+    parser.add_argument('--stream-scoring', action='store_true', help="Score in record batches instead of one predict call")
+    parser.add_argument('--batch-size', type=int, default=65_536)
+    args = parser.parse_args()
+    dynamic_pricing_flow(data_dir=args.data_dir, use_cache=not args.no_cache, refresh=args.refresh,
+                         cache_dir=args.cache_dir, cache_max_bytes=int(args.cache_max_gb * 1024 ** 3),
+                         impute_strategy=args.impute, n_jobs=args.n_jobs,
+                         tune=args.tune, tune_budget_s=args.tune_budget_min * 60,
+                         stream_scoring=args.stream_scoring, batch_size=args.batch_size)
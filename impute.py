@@ -0,0 +1,73 @@
+# impute.py
+import json
+import warnings
+import numpy as np
+import pandas as pd
+
+IMPUTER_PATH = 'models/imputer.json'
+STRATEGIES = ('mean', 'median', 'category')
+
+class Imputer:
+    def __init__(self, strategy='mean', by='category'):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown imputation strategy: {strategy}")
+        self.strategy = strategy
+        self.by = by
+        self.fill_values = {}
+        self.group_values = {}
+
+    def fit(self, df):
+        columns = list(df.select_dtypes(include=np.number).columns)
+        # One pass over a single float block instead of one scan per column
+        block = df[columns].to_numpy(dtype='float64', na_value=np.nan)
+        if self.strategy == 'median':
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                values = np.nanmedian(block, axis=0)
+        else:
+            observed = ~np.isnan(block)
+            counts = observed.sum(axis=0)
+            values = np.where(counts > 0, np.where(observed, block, 0.0).sum(axis=0) / np.maximum(counts, 1), np.nan)
+        self.fill_values = {col: float(v) for col, v in zip(columns, values) if not np.isnan(v)}
+
+        if self.strategy == 'category' and self.by in df.columns:
+            group_means = df.groupby(self.by, observed=True)[columns].mean()
+            self.group_values = {
+                str(key): {col: float(v) for col, v in row.items() if not np.isnan(v)}
+                for key, row in group_means.iterrows()
+            }
+        return self
+
+    def transform(self, df):
+        # Fills in place; per-category values first, global values for whatever is left
+        if self.group_values and self.by in df.columns:
+            group_fill = pd.DataFrame.from_dict(self.group_values, orient='index')
+            group_fill = group_fill.reindex(df[self.by].astype(str).to_numpy())
+            group_fill.index = df.index
+            df.fillna(group_fill, inplace=True)
+        df.fillna({col: v for col, v in self.fill_values.items() if col in df.columns}, inplace=True)
+        return df
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def save(self, path=IMPUTER_PATH):
+        with open(path, 'w') as f:
+            json.dump({
+                'strategy': self.strategy,
+                'by': self.by,
+                'fill_values': self.fill_values,
+                'group_values': self.group_values,
+            }, f, indent=2)
+
+    @classmethod
+    def load(cls, path=IMPUTER_PATH):
+        with open(path) as f:
+            state = json.load(f)
+        imputer = cls(state['strategy'], state['by'])
+        imputer.fill_values = state['fill_values']
+        imputer.group_values = state['group_values']
+        return imputer
+
+def fit_imputer(df, strategy='mean'):
+    return Imputer(strategy).fit(df)
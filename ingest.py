@@ -0,0 +1,119 @@
+# ingest.py
+import os
+import hashlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from pandas.api.types import union_categoricals
+
+AMAZON_FILE = "Amazon Sale Report.csv"
+SALE_FILE = "Sale Report.csv"
+
+# Only the columns the pipeline reads, keyed by their cleaned name
+AMAZON_SCHEMA = {
+    'sku': 'category',
+    'status': 'category',
+    'category': 'category',
+    'qty': 'int32',
+    'amount': 'float32',
+}
+SALE_SCHEMA = {
+    'sku_code': 'category',
+}
+
+# Bump when the parsing logic changes so stale Parquet copies are ignored
+INGEST_VERSION = 1
+
+def _clean_name(name):
+    return name.strip().lower().replace(' ', '_')
+
+def _raw_columns(path, schema):
+    # Map cleaned names back to the raw CSV header so we can project on read
+    header = pd.read_csv(path, nrows=0).columns
+    raw = {_clean_name(c): c for c in header}
+    missing = [c for c in schema if c not in raw]
+    if missing:
+        raise ValueError(f"{os.path.basename(path)} is missing columns: {missing}")
+    return {raw[c]: c for c in schema}
+
+def _apply_schema(df, schema):
+    for col, dtype in schema.items():
+        if dtype == 'category':
+            if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = df[col].astype('category')
+        elif dtype == 'int32':
+            # Integer columns with gaps stay float32 rather than failing the load
+            df[col] = df[col].astype('float32' if df[col].isna().any() else 'int32')
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+def _read_pyarrow(path, columns, schema):
+    column_types = {}
+    for raw, col in columns.items():
+        if schema[col] == 'category':
+            column_types[raw] = pa.dictionary(pa.int32(), pa.string())
+        else:
+            column_types[raw] = pa.float32()
+    table = pacsv.read_csv(
+        path,
+        convert_options=pacsv.ConvertOptions(include_columns=list(columns), column_types=column_types),
+    )
+    return table.to_pandas()
+
+def _read_pandas_chunks(path, columns, schema, chunksize):
+    dtype = {raw: ('category' if schema[col] == 'category' else 'float32') for raw, col in columns.items()}
+    chunks = list(pd.read_csv(path, usecols=list(columns), dtype=dtype, chunksize=chunksize))
+    if not chunks:
+        return pd.DataFrame({raw: pd.Series(dtype=d) for raw, d in dtype.items()})
+    # Chunks carry their own categories, so union them instead of falling back to object
+    data = {}
+    for raw in columns:
+        if dtype[raw] == 'category':
+            data[raw] = union_categoricals([chunk[raw] for chunk in chunks])
+        else:
+            data[raw] = pd.concat([chunk[raw] for chunk in chunks], ignore_index=True)
+    return pd.DataFrame(data)
+
+def source_fingerprint(path, schema):
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}|{sorted(schema.items())}|{INGEST_VERSION}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+def read_table(path, schema, engine='pyarrow', chunksize=1_000_000, cache_dir=None):
+    stem = os.path.splitext(os.path.basename(path))[0].lower().replace(' ', '_')
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, f"{stem}-{source_fingerprint(path, schema)}.parquet")
+        if os.path.exists(cache_path):
+            print(f"⚡ Using cached {cache_path}")
+            return pd.read_parquet(cache_path)
+
+    columns = _raw_columns(path, schema)
+    if engine == 'pyarrow':
+        df = _read_pyarrow(path, columns, schema)
+    elif engine == 'pandas':
+        df = _read_pandas_chunks(path, columns, schema, chunksize)
+    else:
+        raise ValueError(f"Unknown ingestion engine: {engine}")
+
+    df = df.rename(columns=columns)
+    df = _apply_schema(df, schema)
+
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Drop copies made from older versions of the same source
+        for name in os.listdir(cache_dir):
+            if name.startswith(f"{stem}-") and name.endswith('.parquet'):
+                os.remove(os.path.join(cache_dir, name))
+        tmp_path = f"{cache_path}.tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+        print(f"💾 Cached {os.path.basename(path)} to {cache_path}")
+    return df
+
+def dataset_fingerprint(data_dir):
+    return [
+        source_fingerprint(os.path.join(data_dir, AMAZON_FILE), AMAZON_SCHEMA),
+        source_fingerprint(os.path.join(data_dir, SALE_FILE), SALE_SCHEMA),
+    ]
@@ -0,0 +1,228 @@
+# jobs.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+JOBS_DB = 'jobs.db'
+ACTIVE_STATES = ('queued', 'running')
+# A running rescore may already have read the partitions, so a new upload only joins one still queued
+DEDUPE_STATES = {'pipeline': ACTIVE_STATES, 'rescore': ('queued',)}
+PIPELINE_STAGES = ['load', 'synthetic', 'features', 'impute', 'train', 'score', 'publish']
+
+def connect(db_path=JOBS_DB):
+    # WAL lets the dashboard poll while the worker process is writing progress
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    return conn
+
+def init_db(db_path=JOBS_DB):
+    conn = connect(db_path)
+    try:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            params TEXT NOT NULL,
+            dedupe_key TEXT NOT NULL,
+            state TEXT NOT NULL,
+            stage TEXT,
+            progress REAL NOT NULL DEFAULT 0,
+            message TEXT,
+            stages TEXT NOT NULL DEFAULT '[]',
+            error TEXT,
+            submitted_by INTEGER,
+            worker_pid INTEGER,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+        ''')
+        if 'worker_pid' not in [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]:
+            conn.execute('ALTER TABLE jobs ADD COLUMN worker_pid INTEGER')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_active ON jobs (dedupe_key, state)')
+    finally:
+        conn.close()
+
+def dedupe_key(kind, params):
+    return hashlib.sha256(json.dumps([kind, params], sort_keys=True).encode('utf-8')).hexdigest()
+
+def worker_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def submit(kind, params=None, submitted_by=None, db_path=JOBS_DB):
+    # Returns (job_id, created); an identical job that is still queued or running is reused
+    if kind not in DEDUPE_STATES:
+        raise ValueError(f"Unknown job kind: {kind}")
+    params = params or {}
+    key = dedupe_key(kind, params)
+    conn = connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        states = DEDUPE_STATES[kind]
+        row = conn.execute(f"SELECT id, state, worker_pid FROM jobs WHERE dedupe_key=? "
+                           f"AND state IN ({','.join('?' * len(states))}) ORDER BY id LIMIT 1", (key, *states)).fetchone()
+        # A running job whose worker is gone will never finish, so it is failed instead of joined
+        if row and row['state'] == 'running' and not worker_alive(row['worker_pid']):
+            conn.execute("UPDATE jobs SET state='failed', error='Worker process died', finished_at=? WHERE id=?",
+                         (time.time(), row['id']))
+            row = None
+        if row:
+            conn.execute('COMMIT')
+            return row['id'], False
+        cur = conn.execute('INSERT INTO jobs (kind, params, dedupe_key, state, message, submitted_by, created_at) '
+                           'VALUES (?,?,?,?,?,?,?)',
+                           (kind, json.dumps(params), key, 'queued', "Queued...", submitted_by, time.time()))
+        conn.execute('COMMIT')
+        return cur.lastrowid, True
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+def get_job(job_id, db_path=JOBS_DB):
+    conn = connect(db_path)
+    try:
+        row = conn.execute('SELECT * FROM jobs WHERE id=?', (job_id,)).fetchone()
+    finally:
+        conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['stages'] = json.loads(job['stages'])
+    return job
+
+def _update(job_id, db_path=JOBS_DB, **fields):
+    conn = connect(db_path)
+    try:
+        assignments = ', '.join(f"{name}=?" for name in fields)
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id=?", (*fields.values(), job_id))
+    finally:
+        conn.close()
+
+def track_stage(job_id, stage, progress=None, message=None, db_path=JOBS_DB):
+    # Closes the timing of the previous stage and opens the next one; a no-op outside a job
+    if job_id is None:
+        return
+    now = time.time()
+    stages = get_job(job_id, db_path)['stages']
+    if stages and stages[-1]['seconds'] is None:
+        stages[-1]['seconds'] = round(now - stages[-1]['started_at'], 3)
+    if stage is not None and (not stages or stages[-1]['name'] != stage):
+        stages.append({'name': stage, 'started_at': now, 'seconds': None})
+    if progress is None and stage in PIPELINE_STAGES:
+        progress = PIPELINE_STAGES.index(stage) / len(PIPELINE_STAGES)
+    fields = {'stage': stage, 'stages': json.dumps(stages)}
+    if progress is not None:
+        fields['progress'] = progress
+    if message is not None:
+        fields['message'] = message
+    _update(job_id, db_path, **fields)
+
+def fail_job(job_id, error, db_path=JOBS_DB):
+    # Only a job that is still active; one the worker already finished keeps its own outcome
+    conn = connect(db_path)
+    try:
+        conn.execute(f"UPDATE jobs SET state='failed', error=?, finished_at=? WHERE id=? "
+                     f"AND state IN ({','.join('?' * len(ACTIVE_STATES))})",
+                     (error, time.time(), job_id, *ACTIVE_STATES))
+    finally:
+        conn.close()
+
+def run_job(job_id, db_path=JOBS_DB):
+    # Runs in the worker process, so the heavy imports stay out of the dashboard
+    job = get_job(job_id, db_path)
+    _update(job_id, db_path, state='running', worker_pid=os.getpid(), started_at=time.time(), message="Starting...")
+    try:
+        if job['kind'] == 'pipeline':
+            from flow import dynamic_pricing_flow
+            dynamic_pricing_flow(**job['params'], job_id=job_id, jobs_db=db_path)
+        else:
+            from rescore import rescore_partitions
+            rescore_partitions(**job['params'], progress=lambda fraction, message: track_stage(
+                job_id, 'rescore', progress=fraction, message=message, db_path=db_path))
+        track_stage(job_id, None, db_path=db_path)
+        _update(job_id, db_path, state='done', progress=1.0, message="Done", finished_at=time.time())
+    except Exception as e:
+        print(f"❌ Job {job_id} failed: {e}")
+        track_stage(job_id, None, db_path=db_path)
+        _update(job_id, db_path, state='failed', error=str(e), finished_at=time.time())
+
+class JobRunner:
+    # A single worker process: jobs run one after another, so two full retrains never overlap
+    def __init__(self, db_path=JOBS_DB):
+        self.db_path = db_path
+        init_db(db_path)
+        # Anything still active belongs to a runner that no longer exists
+        conn = connect(db_path)
+        try:
+            conn.execute("UPDATE jobs SET state='failed', error='Interrupted by a restart', finished_at=? "
+                         "WHERE state IN (?, ?)", (time.time(), *ACTIVE_STATES))
+        finally:
+            conn.close()
+        self.lock = threading.Lock()
+        self.executor = self._new_executor()
+
+    @staticmethod
+    def _new_executor():
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+
+    def _replace_executor(self, broken):
+        # A worker that died takes the whole pool with it; the next job gets a fresh one
+        with self.lock:
+            if self.executor is broken:
+                print("♻️ Job worker died, starting a new one")
+                self.executor = self._new_executor()
+            return self.executor
+
+    def _dispatch(self, job_id):
+        executor = self.executor
+        for attempt in range(2):
+            try:
+                future = executor.submit(run_job, job_id, os.path.abspath(self.db_path))
+                break
+            except (BrokenProcessPool, RuntimeError) as e:
+                if attempt:
+                    fail_job(job_id, f"Could not start a worker: {e}", self.db_path)
+                    raise
+                executor = self._replace_executor(executor)
+        future.add_done_callback(functools.partial(self._on_done, job_id, executor))
+
+    def _on_done(self, job_id, executor, future):
+        # run_job records its own failures; this catches the ones it can't, like the worker being killed
+        if future.cancelled():
+            fail_job(job_id, "Cancelled", self.db_path)
+            return
+        error = future.exception()
+        if error is None:
+            return
+        print(f"❌ Job {job_id} lost its worker: {error!r}")
+        fail_job(job_id, f"Worker process died: {error!r}", self.db_path)
+        if isinstance(error, BrokenProcessPool):
+            self._replace_executor(executor)
+
+    def submit(self, kind, params=None, submitted_by=None):
+        job_id, created = submit(kind, params, submitted_by, self.db_path)
+        if created:
+            self._dispatch(job_id)
+        return job_id, created
+
+    def status(self, job_id):
+        return get_job(job_id, self.db_path)
@@ -0,0 +1,74 @@
+# kpis.py
+import os
+import json
+import numpy as np
+import pyarrow.parquet as pq
+from topk import TOP_K, TOP_BY, top_k, bucket_top_k
+
+PREDICTIONS_PATH = 'output/suggested_prices.parquet'
+KPI_SUMMARY_PATH = 'output/kpi_summary.json'
+KPI_COLUMNS = ['sku', 'total_quantity', 'suggested_price', 'total_sales']
+COST_COLUMN = 'cost'
+# Bumped when the summary layout changes, so an older file is recomputed rather than misread
+SUMMARY_FORMAT = 3
+MARGIN_EDGES = [-np.inf] + [round(x, 1) for x in np.arange(0.0, 1.01, 0.1)] + [np.inf]
+
+def file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+def kpi_columns(path):
+    # Cost is only there when the source data has it; the pipeline's predictions don't
+    names = pq.read_schema(path).names
+    return KPI_COLUMNS + ([COST_COLUMN] if COST_COLUMN in names else [])
+
+def add_margin(df):
+    # Without a cost column there is no margin to show, so it stays NaN rather than being made up
+    if COST_COLUMN not in df.columns:
+        df['margin'] = np.nan
+        return df
+    price = df['suggested_price'].to_numpy(dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        df['margin'] = np.where(price != 0, (price - df[COST_COLUMN].to_numpy(dtype='float64')) / price, np.nan)
+    return df
+
+def build_kpi_summary(df):
+    margin = df['margin'].to_numpy(dtype='float64')
+    known = margin[~np.isnan(margin)]
+    counts, _ = np.histogram(known, bins=MARGIN_EDGES)
+    return {
+        'format': SUMMARY_FORMAT,
+        'products': int(len(df)),
+        'total_revenue': float(df['total_sales'].sum()),
+        'avg_price': float(df['suggested_price'].mean()),
+        # None when there is no cost data; the dashboard then hides everything margin related
+        'avg_margin': float(known.mean()) if len(known) else None,
+        'margin_range': [float(known.min()), float(known.max())] if len(known) else None,
+        'margin_histogram': {
+            # JSON has no infinity, so the open-ended outer bins are marked with null
+            'edges': [None if np.isinf(e) else e for e in MARGIN_EDGES],
+            'counts': counts.tolist(),
+        },
+        # Row positions in the predictions file, so the unfiltered top products need no scan at all
+        'top_products': {
+            'by': TOP_BY,
+            'k': TOP_K,
+            # Ignoring margin, for when there is no margin filter (always the case without cost data)
+            'all': top_k(df[TOP_BY].to_numpy(), TOP_K, tie_keys=df['sku'].to_numpy()).tolist(),
+            **bucket_top_k(df[TOP_BY].to_numpy(), margin, MARGIN_EDGES, TOP_K, df['sku'].to_numpy()),
+        },
+    }
+
+def write_kpi_summary(predictions_path=PREDICTIONS_PATH, out_path=KPI_SUMMARY_PATH):
+    df = add_margin(pq.read_table(predictions_path, columns=kpi_columns(predictions_path)).to_pandas())
+    summary = build_kpi_summary(df)
+    # Lets readers tell whether the summary still describes the current predictions file
+    summary['source_version'] = file_version(predictions_path)
+    with open(f"{out_path}.tmp", 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(f"{out_path}.tmp", out_path)
+    print(f"📊 KPI summary saved to {out_path}")
+    return summary
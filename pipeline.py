@@ -2,27 +2,31 @@
 import os
 import pandas as pd
 import numpy as np
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import KFold, train_test_split
+from sklearn.base import clone
 from sklearn.linear_model import LinearRegression
 from sklearn.ensemble import RandomForestRegressor
 from xgboost import XGBRegressor
 from sklearn.metrics import mean_squared_error
 import joblib
+from joblib import Parallel, delayed, effective_n_jobs, parallel_config
 import mlflow
 import mlflow.sklearn
-
-def load_and_clean_data(data_dir='data'):
+import pyarrow as pa
+import pyarrow.parquet as pq
+from compile_model import COMPILED_MODEL_PATH, export_compiled
+from aggregates import aggregate_partition, finalize_aggregates, update_state
+from impute import IMPUTER_PATH, Imputer
+from registry import write_best_model
+from tuning import TUNE_VAL_SIZE, tune_candidates
+from ingest import AMAZON_FILE, SALE_FILE, AMAZON_SCHEMA, SALE_SCHEMA, read_table
+
+def load_and_clean_data(data_dir='data', engine='pyarrow', use_cache=True):
     print("✅ Loading datasets...")
-    amazon_df = pd.read_csv(r"C:\Users\KIIT\Desktop\data_engineer_challenge\data\Amazon Sale Report.csv", low_memory=False)
-    sale_df = pd.read_csv(r"C:\Users\KIIT\Desktop\data_engineer_challenge\data\Sale Report.csv")
-
-    def clean(df):
-        df.columns = df.columns.str.strip().str.lower().str.replace(' ', '_')
-        return df
-
-    amazon_df = clean(amazon_df)
-    sale_df = clean(sale_df)
-
+    cache_dir = os.path.join(data_dir, '.cache') if use_cache else None
+    amazon_df = read_table(os.path.join(data_dir, AMAZON_FILE), AMAZON_SCHEMA, engine=engine, cache_dir=cache_dir)
+    sale_df = read_table(os.path.join(data_dir, SALE_FILE), SALE_SCHEMA, engine=engine, cache_dir=cache_dir)
+    print(f"Amazon DF shape: {amazon_df.shape}, Sale DF shape: {sale_df.shape}")
     return amazon_df, sale_df
 
 def generate_synthetic(sale_df):
@@ -34,33 +38,89 @@ def generate_synthetic(sale_df):
     sale_df['total_amount'] = sale_df['quantity'] * sale_df['unit_price']
     return sale_df
 
-def feature_engineering(sale_df, amazon_df):
+def build_sku_features(amazon_df):
+    # One row per SKU instead of one per Amazon order, so the join below stays 1:1
+    grouped = amazon_df.groupby('sku', observed=True)
+    sku_features = pd.DataFrame({
+        'order_count': grouped.size(),
+        'order_qty': grouped['qty'].sum(),
+        'mean_amount': grouped['amount'].mean(),
+        'category': grouped['category'].first(),
+    })
+
+    status_counts = amazon_df.groupby(['sku', 'status'], observed=True).size().unstack(fill_value=0)
+    status_mix = status_counts.div(status_counts.sum(axis=1), axis=0)
+    status_mix.columns = ['status_' + str(c).strip().lower().replace(' - ', '_').replace(' ', '_') for c in status_mix.columns]
+    sku_features = sku_features.join(status_mix)
+
+    sku_features.index = pd.CategoricalIndex(sku_features.index.astype(str), name='sku')
+    return sku_features.sort_index()
+
+def feature_engineering(sale_df, amazon_df, state_dir=None, partition_dir=None):
     print("🔧 Feature engineering...")
-    agg_df = sale_df.groupby('sku').agg({
-        'quantity': 'sum',
-        'unit_price': 'mean',
-        'total_amount': 'sum'
-    }).reset_index()
-
-    agg_df.rename(columns={
-        'quantity': 'total_quantity',
-        'unit_price': 'avg_unit_price',
-        'total_amount': 'total_sales'
-    }, inplace=True)
+    # With a state_dir only partitions not yet folded into the persisted per-SKU sums are aggregated
+    if state_dir:
+        state = update_state(state_dir, sale_df, partition_dir)
+    else:
+        state = aggregate_partition(sale_df)
+    agg_df = finalize_aggregates(state)
 
     if 'sku' in amazon_df.columns:
-        merged = pd.merge(agg_df, amazon_df, on='sku', how='left')
+        sku_features = build_sku_features(amazon_df)
+        merged = pd.merge(agg_df, sku_features, left_on='sku', right_index=True, how='left', validate='one_to_one')
+        # SKUs with no Amazon orders have zero of them rather than an unknown count
+        count_cols = ['order_count', 'order_qty'] + [c for c in sku_features.columns if c.startswith('status_')]
+        merged[count_cols] = merged[count_cols].fillna(0)
+        raw_rows = int(agg_df['sku'].map(sku_features['order_count']).fillna(1).sum())
+        print(f"🔗 Joined Amazon features: {len(agg_df):,} SKUs -> {len(merged):,} rows "
+              f"(order-level merge would have produced {raw_rows:,})")
     else:
         merged = agg_df
 
-    for col in merged.select_dtypes(include=np.number).columns:
-        merged[col] = merged[col].fillna(merged[col].mean())
-
     print("✅ Merged sample:")
     print(merged.head())
     return merged
 
-def train_and_evaluate(X, y):
+def _fit_fold(model, X_train, y_train, X_test):
+    model.fit(X_train, y_train)
+    return model, model.predict(X_test)
+
+def evaluate_candidates(models, X, y, n_splits=5, n_jobs=1, train_only=()):
+    # One fold plan shared by every candidate: each fold is fit exactly once, fold 0 doubles as the holdout.
+    # train_only rows join every training fold but are never scored, so they have no out-of-fold prediction
+    train_only = np.asarray(train_only, dtype=np.intp)
+    scored = np.setdiff1d(np.arange(len(X)), train_only)
+    folds = [(np.sort(np.concatenate([scored[train], train_only])), scored[test])
+             for train, test in KFold(n_splits=n_splits, shuffle=True, random_state=42).split(scored)]
+    tasks = [(name, i, clone(model)) for name, model in models.items() for i in range(len(folds))]
+
+    workers = effective_n_jobs(n_jobs)
+    # Cap the BLAS/OpenMP threads each worker may use so XGBoost/RF don't oversubscribe the cores
+    inner_threads = max(1, (os.cpu_count() or 1) // workers)
+    print(f"⚡ Running {len(tasks)} fits on {workers} worker(s), {inner_threads} thread(s) each")
+    with parallel_config(backend='loky', inner_max_num_threads=inner_threads):
+        outputs = Parallel(n_jobs=workers)(
+            delayed(_fit_fold)(model, X.iloc[folds[i][0]], y.iloc[folds[i][0]], X.iloc[folds[i][1]])
+            for _, i, model in tasks
+        )
+
+    y_values = y.to_numpy()
+    evaluation = {
+        name: {'estimators': [None] * len(folds), 'fold_rmse': [None] * len(folds), 'oof': np.full(len(y), np.nan)}
+        for name in models
+    }
+    for (name, i, _), (model, preds) in zip(tasks, outputs):
+        test_idx = folds[i][1]
+        evaluation[name]['estimators'][i] = model
+        evaluation[name]['fold_rmse'][i] = float(np.sqrt(mean_squared_error(y_values[test_idx], preds)))
+        evaluation[name]['oof'][test_idx] = preds
+    for result in evaluation.values():
+        result['holdout_idx'] = folds[0][1]
+        result['rmse'] = result['fold_rmse'][0]
+        result['cv_rmse'] = float(np.mean(result['fold_rmse']))
+    return evaluation
+
+def train_and_evaluate(X, y, n_jobs=1, tune=False, tune_budget_s=600):
     print("🤖 Training models with MLflow logging...")
     models = {
         'LinearRegression': LinearRegression(),
@@ -68,28 +128,48 @@ def train_and_evaluate(X, y):
         'XGBoost': XGBRegressor(n_estimators=100, random_state=42)
     }
     results = {}
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
 
     os.makedirs("models", exist_ok=True)
 
     mlflow.set_experiment("Dynamic Pricing Experiment")
 
-    for name, model in models.items():
-        print(f"\n🚀 Training {name}...")
+    tuned = set()
+    tune_val_idx = ()
+    if tune:
+        # The rows that pick the hyperparameters and tree counts are kept out of every CV test fold,
+        # otherwise the tuned models' cv_rmse would be scored partly on them and look better than it is
+        tune_idx, tune_val_idx = train_test_split(np.arange(len(X)), test_size=TUNE_VAL_SIZE, random_state=42)
+        tuned_models = tune_candidates(X.iloc[tune_idx], y.iloc[tune_idx], tune_budget_s, n_jobs=n_jobs,
+                                       validation=(X.iloc[tune_val_idx], y.iloc[tune_val_idx]))
+        models.update(tuned_models)
+        tuned = set(tuned_models)
+
+    evaluation = evaluate_candidates(models, X, y, n_jobs=n_jobs, train_only=tune_val_idx)
+    workers = effective_n_jobs(n_jobs)
+
+    # Out-of-fold predictions for every candidate, kept for residual diagnostics
+    oof_path = "models/oof_predictions.parquet"
+    oof = pd.DataFrame({name: result['oof'] for name, result in evaluation.items()}, index=X.index)
+    oof.insert(0, 'actual', y.to_numpy())
+    oof.to_parquet(oof_path)
+
+    # MLflow runs are opened from the parent only
+    for name in models:
+        # The fold-0 estimator was trained on 80% of the data, like the old train/test split model
+        model = evaluation[name]['estimators'][0]
+        rmse, cv_rmse = evaluation[name]['rmse'], evaluation[name]['cv_rmse']
+        print(f"\n🚀 {name} RMSE: {rmse:.2f}, CV RMSE: {cv_rmse:.2f}")
         with mlflow.start_run(run_name=name):
-            # Fit & predict
-            model.fit(X_train, y_train)
-            preds = model.predict(X_test)
-            rmse = np.sqrt(mean_squared_error(y_test, preds))
-            cv_rmse = -cross_val_score(model, X, y, cv=5, scoring='neg_root_mean_squared_error').mean()
-            print(f"{name} RMSE: {rmse:.2f}, CV RMSE: {cv_rmse:.2f}")
-
             # Log parameters & metrics
             mlflow.log_param("model_name", name)
             if hasattr(model, 'n_estimators'):
                 mlflow.log_param("n_estimators", getattr(model, 'n_estimators', None))
+            mlflow.log_param("n_jobs", workers)
+            mlflow.log_param("tuned", name in tuned)
             mlflow.log_metric("rmse", rmse)
             mlflow.log_metric("cv_rmse", cv_rmse)
+            for i, fold_rmse in enumerate(evaluation[name]['fold_rmse']):
+                mlflow.log_metric("fold_rmse", fold_rmse, step=i)
 
             # Save locally
             local_model_path = f"models/{name}.pkl"
@@ -98,6 +178,7 @@ def train_and_evaluate(X, y):
 
             # Log model file as artifact
             mlflow.log_artifact(local_model_path)
+            mlflow.log_artifact(oof_path)
 
             # Optionally log as MLflow model for serving:
             mlflow.sklearn.log_model(model, artifact_path="model")
@@ -107,11 +188,66 @@ def train_and_evaluate(X, y):
     # Pick best model by lowest CV RMSE
     best_model_name = min(results, key=lambda k: results[k][2])
     best_model = results[best_model_name][0]
+    # Fails the run rather than publishing a compiled model that disagrees with the original on the holdout fold
+    export_compiled(best_model, X.iloc[evaluation[best_model_name]['holdout_idx']], COMPILED_MODEL_PATH)
+    write_best_model(best_model_name, f"models/{best_model_name}.pkl", X.columns,
+                     {'rmse': results[best_model_name][1], 'cv_rmse': results[best_model_name][2]},
+                     compiled_path=COMPILED_MODEL_PATH)
     print(f"\n✅ Best model: {best_model_name}")
     return best_model
 
-def save_predictions(df, model, features, out_path='output/suggested_prices.parquet'):
+def save_predictions(df, model, features, out_path='output/suggested_prices.parquet', imputer_path=IMPUTER_PATH):
+    # Apply the fill fitted at training time so unseen rows are scored exactly like the training set
+    if imputer_path and os.path.exists(imputer_path):
+        Imputer.load(imputer_path).transform(df)
     df['suggested_price'] = model.predict(df[features])
     os.makedirs(os.path.dirname(out_path), exist_ok=True)
     df.to_parquet(out_path, index=False)
     print(f"🎉 Predictions saved to {out_path}")
+
+def _iter_feature_batches(source, columns, batch_size):
+    if isinstance(source, pd.DataFrame):
+        table = pa.Table.from_pandas(source[columns], preserve_index=False)
+        yield from table.to_batches(max_chunksize=batch_size)
+    else:
+        yield from pq.ParquetFile(source).iter_batches(batch_size=batch_size, columns=columns)
+
+def stream_predictions(source, model, features, out_path='output/suggested_prices.parquet', id_cols=('sku',),
+                       batch_size=65_536, row_group_size=262_144, imputer_path=IMPUTER_PATH):
+    # Scores a feature table (DataFrame or Parquet path) batch by batch, never holding all predictions at once
+    imputer = Imputer.load(imputer_path) if imputer_path and os.path.exists(imputer_path) else None
+    columns = list(dict.fromkeys([*id_cols, *features]))
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = f"{out_path}.tmp"
+
+    writer = None
+    pending, pending_rows, total_rows = [], 0, 0
+    try:
+        for batch in _iter_feature_batches(source, columns, batch_size):
+            chunk = batch.to_pandas()
+            if imputer is not None:
+                imputer.transform(chunk)
+            chunk['suggested_price'] = model.predict(chunk[features])
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            else:
+                table = table.cast(writer.schema)
+            pending.append(table)
+            pending_rows += len(table)
+            total_rows += len(table)
+            # Buffer small batches so each row group reaches row_group_size
+            if pending_rows >= row_group_size:
+                writer.write_table(pa.concat_tables(pending), row_group_size=row_group_size)
+                pending, pending_rows = [], 0
+        if writer is None:
+            raise ValueError("No rows to score")
+        if pending:
+            writer.write_table(pa.concat_tables(pending), row_group_size=row_group_size)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # Readers only ever see a complete file
+    os.replace(tmp_path, out_path)
+    print(f"🎉 Streamed {total_rows:,} predictions to {out_path}")
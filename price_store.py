@@ -0,0 +1,88 @@
+# price_store.py
+import os
+import time
+import shutil
+import numpy as np
+import pyarrow.parquet as pq
+from kpis import PREDICTIONS_PATH
+
+STORE_DIR = 'output/price_store'
+CURRENT_FILE = 'CURRENT'
+KEEP_VERSIONS = 2
+
+def build_price_store(predictions_path=PREDICTIONS_PATH, store_dir=STORE_DIR):
+    table = pq.read_table(predictions_path, columns=['sku', 'suggested_price'])
+    skus = np.array([s.encode('utf-8') for s in table['sku'].to_pylist()])
+    prices = table['suggested_price'].to_numpy().astype('float32')
+
+    # Sorted keys make lookups a binary search; on duplicate SKUs the last row wins
+    order = np.argsort(skus, kind='stable')
+    skus, prices = skus[order], prices[order]
+    last = np.append(skus[1:] != skus[:-1], True)
+    skus, prices = skus[last], prices[last]
+
+    version = f"v{time.time_ns()}"
+    version_dir = os.path.join(store_dir, version)
+    os.makedirs(version_dir)
+    np.save(os.path.join(version_dir, 'skus.npy'), skus)
+    np.save(os.path.join(version_dir, 'prices.npy'), prices)
+
+    # Publishing is a single rename of the CURRENT pointer
+    current_path = os.path.join(store_dir, CURRENT_FILE)
+    with open(f"{current_path}.tmp", 'w') as f:
+        f.write(version)
+    os.replace(f"{current_path}.tmp", current_path)
+
+    # Readers may still have the previous version mapped, so keep it around
+    versions = sorted(v for v in os.listdir(store_dir) if v.startswith('v'))
+    for old in versions[:-KEEP_VERSIONS]:
+        shutil.rmtree(os.path.join(store_dir, old), ignore_errors=True)
+    print(f"🗂️ Published price store {version} with {len(skus):,} SKUs")
+    return version
+
+class PriceStore:
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.current = None
+        self.refresh()
+
+    def refresh(self):
+        with open(os.path.join(self.store_dir, CURRENT_FILE)) as f:
+            version = f.read().strip()
+        if self.current and self.current['version'] == version:
+            return False
+        version_dir = os.path.join(self.store_dir, version)
+        skus = np.load(os.path.join(version_dir, 'skus.npy'), mmap_mode='r')
+        prices = np.load(os.path.join(version_dir, 'prices.npy'), mmap_mode='r')
+        # Swapped as one object so a lookup never mixes keys and prices from different versions
+        self.current = {'version': version, 'skus': skus, 'prices': prices}
+        return True
+
+    def __len__(self):
+        return len(self.current['skus'])
+
+    def get(self, sku):
+        current = self.current
+        skus = current['skus']
+        key = sku.encode('utf-8')
+        if len(key) > skus.dtype.itemsize:
+            return None
+        i = np.searchsorted(skus, key)
+        if i < len(skus) and skus[i] == key:
+            return float(current['prices'][i])
+        return None
+
+    def get_many(self, skus):
+        # Returns prices with NaN for unknown SKUs, plus the found mask
+        current = self.current
+        store_skus = current['skus']
+        if not len(store_skus) or not len(skus):
+            return np.full(len(skus), np.nan), np.zeros(len(skus), dtype=bool)
+        encoded = [s.encode('utf-8') for s in skus]
+        width = store_skus.dtype.itemsize
+        keys = np.array(encoded, dtype=f"S{width}")
+        # Keys longer than the widest stored SKU were truncated by the cast and can't match
+        fits = np.array([len(k) <= width for k in encoded])
+        idx = np.minimum(np.searchsorted(store_skus, keys), len(store_skus) - 1)
+        found = fits & (store_skus[idx] == keys)
+        return np.where(found, current['prices'][idx], np.nan), found
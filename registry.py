@@ -0,0 +1,32 @@
+# registry.py
+import os
+import json
+import joblib
+from compile_model import CompiledModel
+
+BEST_MODEL_PATH = 'models/best_model.json'
+
+def write_best_model(name, model_path, features, metrics, compiled_path=None, path=BEST_MODEL_PATH):
+    info = {'name': name, 'model_path': model_path, 'compiled_path': compiled_path,
+            'features': list(features), 'metrics': metrics}
+    # Written last and renamed into place so watchers only ever see a complete pointer
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(info, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+    return info
+
+def read_best_model(path=BEST_MODEL_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+def best_model_files(path=BEST_MODEL_PATH):
+    # Everything a published model needs on disk, pointer last so it is only replaced once the rest are
+    info = read_best_model(path)
+    return [info['model_path']] + ([info['compiled_path']] if info.get('compiled_path') else []) + [path]
+
+def load_best_model(path=BEST_MODEL_PATH, compiled=False):
+    info = read_best_model(path)
+    # The compiled arrays load and predict much faster than the pickled estimator
+    if compiled and info.get('compiled_path') and os.path.exists(info['compiled_path']):
+        return CompiledModel.load(info['compiled_path']), info
+    return joblib.load(info['model_path']), info
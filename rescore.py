@@ -0,0 +1,118 @@
+# rescore.py
+import os
+import time
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from aggregates import (fold_partitions, finalize_aggregates, partition_id, list_partitions, load_manifest,
+                        save_state)
+from impute import IMPUTER_PATH, Imputer
+from registry import BEST_MODEL_PATH, load_best_model
+from kpis import PREDICTIONS_PATH, write_kpi_summary
+from price_store import build_price_store
+
+# Same columns generate_synthetic gives the sales history, which is what the aggregates are built from
+UPLOAD_SCHEMA = {
+    'sku': 'str',
+    'quantity': 'int64',
+    'unit_price': 'float64',
+    'total_amount': 'float64',
+}
+COLUMN_ALIASES = {'sku_code': 'sku'}
+AGGREGATE_COLUMNS = ['total_quantity', 'avg_unit_price', 'total_sales']
+ORDER_COUNT_COLUMNS = ['order_count', 'order_qty']
+
+def validate_upload(source):
+    df = pd.read_csv(source)
+    df.columns = [COLUMN_ALIASES.get(c, c) for c in (str(c).strip().lower().replace(' ', '_') for c in df.columns)]
+    if 'total_amount' not in df.columns and {'quantity', 'unit_price'} <= set(df.columns):
+        df['total_amount'] = df['quantity'] * df['unit_price']
+    missing = [c for c in UPLOAD_SCHEMA if c not in df.columns]
+    if missing:
+        raise ValueError(f"Upload is missing columns: {missing}")
+    df = df[list(UPLOAD_SCHEMA)].copy()
+    if df.empty:
+        raise ValueError("Upload has no rows")
+
+    df['sku'] = df['sku'].astype('string').str.strip()
+    if df['sku'].isna().any() or (df['sku'] == '').any():
+        raise ValueError("Upload has rows without a SKU")
+    for col in ['quantity', 'unit_price', 'total_amount']:
+        values = pd.to_numeric(df[col], errors='coerce')
+        bad = values.isna() | (values < 0)
+        if bad.any():
+            rows = ', '.join(str(i + 2) for i in df.index[bad][:5])
+            raise ValueError(f"Column '{col}' needs non-negative numbers (CSV line {rows})")
+        df[col] = values
+    if (df['quantity'] % 1 != 0).any():
+        raise ValueError("Column 'quantity' must be whole numbers")
+    return df.astype(UPLOAD_SCHEMA)
+
+def write_partition(df, partition_dir):
+    # Named by content so uploading the same file twice doesn't double count it
+    digest = partition_id(df)
+    for name in list_partitions(partition_dir):
+        if name.endswith(f"-{digest}.parquet"):
+            return None
+    os.makedirs(partition_dir, exist_ok=True)
+    path = os.path.join(partition_dir, f"upload-{time.time_ns()}-{digest}.parquet")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    return path
+
+def unfolded_partitions(partition_dir, state_dir='state'):
+    # Partitions on disk that no rescore has folded in yet, e.g. because its job never ran
+    folded = set(load_manifest(state_dir)['partitions'])
+    return [name for name in list_partitions(partition_dir) if name not in folded]
+
+def _report(progress, fraction, message):
+    print(message)
+    if progress:
+        progress(fraction, message)
+
+def rescore_partitions(partition_dir='data/partitions', state_dir='state', predictions_path=PREDICTIONS_PATH,
+                       pointer_path=BEST_MODEL_PATH, imputer_path=IMPUTER_PATH, progress=None):
+    # Only SKUs that appear in the new partitions get new aggregates and a new prediction
+    _report(progress, 0.1, "📥 Folding new partitions into the SKU aggregates...")
+    # The folded state is only saved once the predictions reflect it, so a failed run is simply redone
+    state, manifest, affected = fold_partitions(state_dir, partition_dir, save=False)
+    if not len(affected):
+        _report(progress, 1.0, "✅ Nothing new to rescore")
+        return 0
+
+    _report(progress, 0.3, f"🔧 Updating features for {len(affected):,} SKUs...")
+    updates = finalize_aggregates(state.loc[affected]).set_index('sku')
+    predictions = pq.read_table(predictions_path).to_pandas()
+    predictions['sku'] = predictions['sku'].astype(str)
+    predictions = predictions.set_index('sku')
+    new_skus = updates.index.difference(predictions.index)
+    rows = predictions.reindex(updates.index)
+    rows[AGGREGATE_COLUMNS] = updates[AGGREGATE_COLUMNS]
+    # New SKUs have no Amazon orders yet, which the pipeline records as zero counts
+    count_cols = [c for c in ORDER_COUNT_COLUMNS if c in rows.columns] + \
+                 [c for c in rows.columns if c.startswith('status_')]
+    rows.loc[new_skus, count_cols] = rows.loc[new_skus, count_cols].fillna(0)
+
+    _report(progress, 0.5, "🤖 Scoring with the saved best model...")
+    model, info = load_best_model(pointer_path, compiled=True)
+    if imputer_path and os.path.exists(imputer_path):
+        Imputer.load(imputer_path).transform(rows)
+    rows['suggested_price'] = model.predict(rows[info['features']].to_numpy(dtype='float64'))
+
+    _report(progress, 0.7, "💾 Writing predictions...")
+    # Keep the file's column types; reindexing turned integer columns into floats
+    for col, dtype in predictions.dtypes.items():
+        if rows[col].dtype != dtype and rows[col].notna().all():
+            rows[col] = rows[col].astype(dtype)
+    known = rows.index.difference(new_skus)
+    predictions.loc[known, rows.columns] = rows.loc[known]
+    predictions = pd.concat([predictions, rows.loc[new_skus]]).reset_index()
+    pq.write_table(pa.Table.from_pandas(predictions, preserve_index=False), f"{predictions_path}.tmp")
+    os.replace(f"{predictions_path}.tmp", predictions_path)
+    save_state(state_dir, state, manifest)
+
+    _report(progress, 0.85, "🗂️ Publishing price store and KPI summary...")
+    build_price_store(predictions_path)
+    write_kpi_summary(predictions_path)
+    _report(progress, 1.0, f"✅ Rescored {len(rows):,} SKUs ({len(new_skus):,} new)")
+    return len(rows)
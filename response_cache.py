@@ -0,0 +1,125 @@
+# response_cache.py
+import re
+import time
+import hashlib
+import numpy as np
+from db import DB_PATH, get_conn
+
+CACHE_TTL_S = 24 * 3600
+CACHE_MAX_ENTRIES = 1000
+SIMILARITY_THRESHOLD = 0.85
+EMBEDDING_DIM = 256
+
+def init_cache(db_path=DB_PATH):
+    with get_conn(db_path) as conn:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS response_cache (
+            key TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
+            version TEXT NOT NULL,
+            response TEXT NOT NULL,
+            embedding BLOB,
+            latency_s REAL NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0
+        )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_version ON response_cache (version, created_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_response_cache_lru ON response_cache (last_used_at)')
+        # Counters outlive evicted entries, so the hit rate covers every lookup
+        conn.execute('CREATE TABLE IF NOT EXISTS response_cache_stats (name TEXT PRIMARY KEY, value REAL NOT NULL)')
+        conn.commit()
+
+def normalize(question):
+    # "What is the average margin?" and "what is  the average margin" share one entry
+    return ' '.join(re.sub(r"[^\w\s%.-]", ' ', question.lower()).split()).strip(' .')
+
+def version_key(*parts):
+    return '|'.join(str(p) for p in parts)
+
+def hashing_embedding(text, dim=EMBEDDING_DIM):
+    # A local bag of words and word pairs hashed into a fixed vector; cheap, and good enough for near-duplicates
+    words = normalize(text).split()
+    features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vec = np.zeros(dim, dtype='float32')
+    for feature in features:
+        h = int.from_bytes(hashlib.md5(feature.encode('utf-8')).digest()[:4], 'little')
+        vec[h % dim] += 1.0 if h & (1 << 31) else -1.0
+    norm = np.linalg.norm(vec)
+    return vec / norm if norm else vec
+
+class ResponseCache:
+    # Answers keyed on the normalized question plus the data/model version, with TTL and LRU eviction.
+    # With an embed function, a near-duplicate question can also reuse an answer for the same version.
+    def __init__(self, db_path=DB_PATH, ttl_s=CACHE_TTL_S, max_entries=CACHE_MAX_ENTRIES, embed=None,
+                 threshold=SIMILARITY_THRESHOLD):
+        self.db_path = db_path
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.embed = embed
+        self.threshold = threshold
+        init_cache(db_path)
+
+    def _key(self, question, version):
+        return hashlib.sha256(f"{version}\n{question}".encode('utf-8')).hexdigest()
+
+    def get(self, question, version):
+        # Returns (response, seconds the original call took) or None
+        with get_conn(self.db_path) as conn:
+            return self._get(conn, normalize(question), version)
+
+    def _get(self, conn, question, version):
+        now = time.time()
+        row = conn.execute('SELECT key, response, latency_s FROM response_cache WHERE key=? AND created_at>=?',
+                           (self._key(question, version), now - self.ttl_s)).fetchone()
+        if row is None and self.embed is not None:
+            row = self._similar(conn, question, version, now)
+        with conn:
+            self._bump(conn, 'lookups')
+            if row is None:
+                return None
+            conn.execute('UPDATE response_cache SET hits = hits + 1, last_used_at=? WHERE key=?', (now, row[0]))
+            self._bump(conn, 'hits')
+            self._bump(conn, 'saved_s', row[2])
+        return row[1], row[2]
+
+    def _similar(self, conn, question, version, now):
+        rows = conn.execute('SELECT key, response, latency_s, embedding FROM response_cache '
+                            'WHERE version=? AND created_at>=? AND embedding IS NOT NULL',
+                            (version, now - self.ttl_s)).fetchall()
+        if not rows:
+            return None
+        matrix = np.stack([np.frombuffer(r[3], dtype='float32') for r in rows])
+        scores = matrix @ np.asarray(self.embed(question), dtype='float32')
+        best = int(np.argmax(scores))
+        return rows[best][:3] if scores[best] >= self.threshold else None
+
+    def put(self, question, version, response, latency_s):
+        question = normalize(question)
+        now = time.time()
+        embedding = np.asarray(self.embed(question), dtype='float32').tobytes() if self.embed is not None else None
+        with get_conn(self.db_path) as conn, conn:
+            conn.execute('INSERT OR REPLACE INTO response_cache '
+                         '(key, question, version, response, embedding, latency_s, created_at, last_used_at, hits) '
+                         'VALUES (?,?,?,?,?,?,?,?,0)',
+                         (self._key(question, version), question, version, response, embedding, latency_s, now, now))
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute('DELETE FROM response_cache WHERE created_at<?', (now - self.ttl_s,))
+        conn.execute('DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache '
+                     'ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+    @staticmethod
+    def _bump(conn, name, amount=1):
+        conn.execute('INSERT INTO response_cache_stats (name, value) VALUES (?, ?) '
+                     'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value', (name, amount))
+
+    def stats(self):
+        with get_conn(self.db_path) as conn:
+            values = dict(conn.execute('SELECT name, value FROM response_cache_stats').fetchall())
+            entries = conn.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+        lookups, hits = int(values.get('lookups', 0)), int(values.get('hits', 0))
+        return {'lookups': lookups, 'hits': hits, 'hit_rate': hits / lookups if lookups else 0.0,
+                'saved_s': values.get('saved_s', 0.0), 'entries': entries}
@@ -0,0 +1,235 @@
+# serve.py
+import os
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from flask import Flask, request, jsonify
+from compile_model import CompiledModel
+from impute import IMPUTER_PATH, Imputer
+from registry import BEST_MODEL_PATH, load_best_model
+from price_store import STORE_DIR, CURRENT_FILE, PriceStore
+
+class ModelHolder:
+    def __init__(self, pointer_path=BEST_MODEL_PATH, imputer_path=IMPUTER_PATH):
+        self.pointer_path = pointer_path
+        self.imputer_path = imputer_path
+        self.current = None
+        self._mtime = None
+        self.reload()
+
+    def reload(self):
+        mtime = os.stat(self.pointer_path).st_mtime_ns
+        model, info = load_best_model(self.pointer_path, compiled=True)
+        features = info['features']
+        fill = np.full(len(features), np.nan)
+        if os.path.exists(self.imputer_path):
+            fill_values = Imputer.load(self.imputer_path).fill_values
+            fill = np.array([fill_values.get(f, np.nan) for f in features])
+        # A single attribute swap, so in-flight batches keep the model they started with
+        compiled = isinstance(model, CompiledModel)
+        self.current = {'model': model, 'name': info['name'], 'features': features, 'fill': fill,
+                        'compiled': compiled, 'loaded_at': time.time()}
+        self._mtime = mtime
+        print(f"📦 Loaded {info['name']} ({'compiled' if compiled else 'pickled'})")
+
+    def maybe_reload(self):
+        if os.stat(self.pointer_path).st_mtime_ns != self._mtime:
+            self.reload()
+
+class StoreHolder:
+    # The server may start before the flow first publishes prices, so the store opens once CURRENT appears
+    def __init__(self, store=None, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+        self.store = store
+        self.refresh()
+
+    def refresh(self):
+        # True when a new store version was swapped in
+        if self.store is None:
+            if not os.path.exists(os.path.join(self.store_dir, CURRENT_FILE)):
+                return False
+            self.store = PriceStore(self.store_dir)
+            return True
+        return self.store.refresh()
+
+def _watch(holder, stores, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            holder.maybe_reload()
+            if stores.refresh():
+                print(f"🗂️ Swapped in price store {stores.store.current['version']}")
+        except Exception as e:
+            # Keep serving the old model and prices if the new ones are missing or half-written
+            print(f"⚠️ Reload failed: {e}")
+
+class MicroBatcher:
+    def __init__(self, holder, max_batch=256, max_wait_ms=2.0):
+        self.holder = holder
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+
+    def predict(self, rows):
+        done = threading.Event()
+        slot = {'rows': rows, 'done': done}
+        self.requests.put(slot)
+        done.wait()
+        if 'error' in slot:
+            raise slot['error']
+        return slot['result']
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            size = len(batch[0]['rows'])
+            deadline = time.perf_counter() + self.max_wait
+            # Collect whatever else arrives within the window so concurrent requests share one predict call
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    slot = self.requests.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(slot)
+                size += len(slot['rows'])
+            self._score(batch)
+
+    @staticmethod
+    def _predict(current, rows):
+        X = np.array(rows, dtype='float64')
+        X = np.where(np.isnan(X), current['fill'], X)
+        if current['compiled']:
+            return current['model'].predict(X)
+        return current['model'].predict(pd.DataFrame(X, columns=current['features']))
+
+    def _score(self, batch):
+        current = self.holder.current
+        try:
+            preds = self._predict(current, [row for slot in batch for row in slot['rows']])
+            offset = 0
+            for slot in batch:
+                n = len(slot['rows'])
+                slot['result'] = preds[offset:offset + n].tolist()
+                offset += n
+        except Exception:
+            # Score each request on its own so only the one that breaks the model fails
+            for slot in batch:
+                try:
+                    slot['result'] = self._predict(current, slot['rows']).tolist()
+                except Exception as e:
+                    slot['error'] = e
+        for slot in batch:
+            slot['done'].set()
+
+def _parse_instances(payload):
+    if isinstance(payload, dict) and 'instances' in payload:
+        instances, single = payload['instances'], False
+    elif isinstance(payload, list):
+        instances, single = payload, False
+    elif isinstance(payload, dict):
+        instances, single = [payload], True
+    else:
+        raise ValueError("Expected a JSON object or a list of objects")
+    if not all(isinstance(item, dict) for item in instances):
+        raise ValueError("Each instance must be a JSON object")
+    return instances, single
+
+def _feature_row(item, features):
+    # Missing features become NaN and are filled with the training-time imputation values
+    row = [float(item[f]) if item.get(f) is not None else np.nan for f in features]
+    for f, value in zip(features, row):
+        if item.get(f) is not None and not np.isfinite(value):
+            raise ValueError(f"Feature '{f}' must be a finite number")
+    return row
+
+def create_app(holder=None, store=None, max_batch=256, max_wait_ms=2.0, watch_interval=1.0):
+    holder = holder or ModelHolder()
+    stores = StoreHolder(store)
+    batcher = MicroBatcher(holder, max_batch=max_batch, max_wait_ms=max_wait_ms)
+    threading.Thread(target=batcher.run, daemon=True).start()
+    if watch_interval:
+        threading.Thread(target=_watch, args=(holder, stores, watch_interval), daemon=True).start()
+
+    app = Flask(__name__)
+
+    @app.get('/health')
+    def health():
+        current = holder.current
+        store = stores.store
+        return jsonify({'status': 'ok', 'model': current['name'], 'compiled': current['compiled'],
+                        'features': current['features'],
+                        'loaded_at': current['loaded_at'],
+                        'price_store': store.current['version'] if store is not None else None})
+
+    @app.get('/price')
+    def price():
+        skus = request.args.getlist('sku')
+        store = stores.store
+        if store is None:
+            return jsonify({'error': "No price store has been published"}), 503
+        if not skus:
+            return jsonify({'error': "Pass one or more ?sku= parameters"}), 400
+        prices, found = store.get_many(skus)
+        return jsonify({'prices': [{'sku': sku, 'suggested_price': float(p) if ok else None}
+                                   for sku, p, ok in zip(skus, prices, found)]})
+
+    @app.post('/predict')
+    def predict():
+        start = time.perf_counter()
+        features = holder.current['features']
+        store = stores.store
+        try:
+            instances, single = _parse_instances(request.get_json(force=True))
+            # Only rows with at least one feature value go to the model; the rest are SKU lookups
+            # in the precomputed store, and an unknown SKU gets no price rather than a made-up one
+            has_features = [any(item.get(f) is not None for f in features) for item in instances]
+            results = [None if scored else {'suggested_price': None, 'source': None} for scored in has_features]
+            lookup = [i for i, item in enumerate(instances) if not has_features[i] and 'sku' in item]
+            if lookup and store is not None:
+                prices, found = store.get_many([str(instances[i]['sku']) for i in lookup])
+                for i, p, ok in zip(lookup, prices, found):
+                    if ok:
+                        results[i] = {'suggested_price': float(p), 'source': 'lookup'}
+            to_score = [i for i, scored in enumerate(has_features) if scored]
+            rows = [_feature_row(instances[i], features) for i in to_score]
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': str(e)}), 400
+
+        if single and results[0] is not None and results[0]['source'] is None:
+            if 'sku' not in instances[0]:
+                return jsonify({'error': f"Pass a sku or at least one of {features}"}), 400
+            return jsonify({'error': f"Unknown SKU {instances[0]['sku']}", 'sku': instances[0]['sku'],
+                            'suggested_price': None}), 404
+        if rows:
+            try:
+                preds = batcher.predict(rows)
+            except Exception as e:
+                return jsonify({'error': f"Scoring failed: {e}"}), 500
+            for i, p in zip(to_score, preds):
+                results[i] = {'suggested_price': p, 'source': 'model'}
+        for item, result in zip(instances, results):
+            if 'sku' in item:
+                result['sku'] = item['sku']
+        body = results[0] if single else {'predictions': results}
+        response = jsonify(body)
+        response.headers['X-Model'] = holder.current['name']
+        response.headers['X-Latency-Ms'] = f"{(time.perf_counter() - start) * 1000:.3f}"
+        return response
+
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve suggested prices from the best trained model")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch', type=int, default=256, help="Largest number of rows scored in one predict call")
+    parser.add_argument('--max-wait-ms', type=float, default=2.0, help="How long to wait for more requests to batch")
+    args = parser.parse_args()
+    app = create_app(max_batch=args.max_batch, max_wait_ms=args.max_wait_ms)
+    app.run(host=args.host, port=args.port, threaded=True)
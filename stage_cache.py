@@ -0,0 +1,133 @@
+# stage_cache.py
+import os
+import inspect
+import hashlib
+import joblib
+import pandas as pd
+
+DEFAULT_CACHE_DIR = '.stage_cache'
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+
+def _hash_value(h, value):
+    if isinstance(value, pd.DataFrame):
+        h.update(b'df')
+        h.update(repr(list(zip(value.columns, map(str, value.dtypes)))).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, pd.Series):
+        h.update(b'series')
+        h.update(f"{value.name}|{value.dtype}".encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, (list, tuple)):
+        h.update(f"seq{len(value)}".encode('utf-8'))
+        for item in value:
+            _hash_value(h, item)
+    elif isinstance(value, dict):
+        h.update(f"dict{len(value)}".encode('utf-8'))
+        for k in sorted(value, key=repr):
+            _hash_value(h, k)
+            _hash_value(h, value[k])
+    else:
+        h.update(joblib.hash(value).encode('utf-8'))
+
+def _code_hash(h, fn, deps):
+    # The whole defining module, so helpers next to the stage function are covered, plus the
+    # other modules a stage calls into, so editing them invalidates the stage too
+    for module in [inspect.getmodule(fn), *deps]:
+        h.update(inspect.getsource(module).encode('utf-8'))
+
+class StageCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+    def key(self, name, fn, args=(), kwargs=None, deps=(), extra_key=None):
+        h = hashlib.sha256(name.encode('utf-8'))
+        _code_hash(h, fn, deps)
+        _hash_value(h, list(args))
+        _hash_value(h, kwargs or {})
+        _hash_value(h, extra_key)
+        return h.hexdigest()[:24]
+
+    def _paths(self, name, key):
+        base = os.path.join(self.cache_dir, f"{name}-{key}")
+        return f"{base}.parquet", f"{base}.joblib", f"{base}.outputs.joblib"
+
+    @staticmethod
+    def _snapshot(paths, outputs_path):
+        files = {}
+        for path in paths:
+            with open(path, 'rb') as f:
+                files[path] = f.read()
+        joblib.dump(files, f"{outputs_path}.tmp")
+        os.replace(f"{outputs_path}.tmp", outputs_path)
+
+    @staticmethod
+    def _restore(outputs_path):
+        # Written back in the order they were listed, each renamed into place
+        for path, data in joblib.load(outputs_path).items():
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+
+    def run(self, name, fn, *args, deps=(), extra_key=None, outputs=None, **kwargs):
+        # `outputs` lists the files the stage writes as a side effect, or is called after the stage runs
+        # to list them. They are stored with the entry and put back on a hit, so the files on disk always
+        # belong to the same run as the returned value.
+        if not self.enabled:
+            return fn(*args, **kwargs)
+
+        key = self.key(name, fn, args, kwargs, deps, extra_key)
+        parquet_path, joblib_path, outputs_path = self._paths(name, key)
+        for path in (parquet_path, joblib_path):
+            if os.path.exists(path) and (outputs is None or os.path.exists(outputs_path)):
+                print(f"⏭️ Skipping {name} (cached {key})")
+                os.utime(path)
+                if outputs is not None:
+                    os.utime(outputs_path)
+                    self._restore(outputs_path)
+                return pd.read_parquet(path) if path == parquet_path else joblib.load(path)
+
+        result = fn(*args, **kwargs)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = parquet_path if isinstance(result, pd.DataFrame) else joblib_path
+        tmp_path = f"{path}.tmp"
+        if isinstance(result, pd.DataFrame):
+            result.to_parquet(tmp_path, index=False)
+        else:
+            joblib.dump(result, tmp_path)
+        os.replace(tmp_path, path)
+        if outputs is not None:
+            self._snapshot(outputs() if callable(outputs) else outputs, outputs_path)
+        self.evict()
+        return result
+
+    def evict(self):
+        # Least recently used entries go first; hits refresh the mtime
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isfile(path) and not name.endswith('.tmp'):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            print(f"🧹 Evicted {os.path.basename(path)}")
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if os.path.isfile(path):
+                os.remove(path)
+        print(f"🧹 Cleared stage cache at {self.cache_dir}")
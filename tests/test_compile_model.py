@@ -0,0 +1,67 @@
+# tests/test_compile_model.py
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.model_selection import train_test_split
+from xgboost import XGBRegressor
+from compile_model import CompiledModel, compile_model, check_parity
+
+FEATURES = ['total_quantity', 'avg_unit_price']
+
+def make_data(n=2000, missing=0.0, seed=0):
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame({'total_quantity': rng.integers(1, 500, n).astype('float64'),
+                      'avg_unit_price': rng.uniform(50, 2000, n)})
+    y = X['total_quantity'] * X['avg_unit_price'] * rng.uniform(0.8, 1.2, n)
+    if missing:
+        # Missing values in both training and holdout rows, so the learned default directions are exercised
+        for col in FEATURES:
+            X.loc[rng.random(n) < missing, col] = np.nan
+    return train_test_split(X, y, test_size=0.2, random_state=42)
+
+def assert_parity(model, X_train, y_train, X_holdout, **fit_kwargs):
+    model.fit(X_train, y_train, **fit_kwargs)
+    compiled = compile_model(model)
+    check_parity(model, compiled, X_holdout)
+    return compiled
+
+def test_linear_regression_parity():
+    X_train, X_holdout, y_train, _ = make_data()
+    assert_parity(LinearRegression(), X_train, y_train, X_holdout)
+
+@pytest.mark.parametrize('missing', [0.0, 0.1])
+def test_random_forest_parity(missing):
+    X_train, X_holdout, y_train, _ = make_data(missing=missing)
+    assert_parity(RandomForestRegressor(n_estimators=30, max_depth=12, random_state=42), X_train, y_train, X_holdout)
+
+@pytest.mark.parametrize('missing', [0.0, 0.1])
+def test_xgboost_parity(missing):
+    X_train, X_holdout, y_train, _ = make_data(missing=missing)
+    compiled = assert_parity(XGBRegressor(n_estimators=50, max_depth=5, random_state=42), X_train, y_train, X_holdout)
+    if missing:
+        # Some splits must send missing values left for the NaN rows to mean anything
+        assert compiled.arrays['default_left'].any()
+
+def test_xgboost_early_stopping_uses_best_iteration():
+    X_train, X_holdout, y_train, y_holdout = make_data(missing=0.1)
+    model = XGBRegressor(n_estimators=500, learning_rate=0.3, early_stopping_rounds=5, random_state=42)
+    compiled = assert_parity(model, X_train, y_train, X_holdout, eval_set=[(X_holdout, y_holdout)], verbose=False)
+    assert model.best_iteration + 1 < model.get_booster().num_boosted_rounds()
+    assert len(compiled.arrays['roots']) == model.best_iteration + 1
+
+def test_check_parity_rejects_divergent_model():
+    X_train, X_holdout, y_train, _ = make_data()
+    model = LinearRegression().fit(X_train, y_train)
+    compiled = compile_model(model)
+    compiled.arrays['intercept'] = compiled.arrays['intercept'] + 1e3
+    with pytest.raises(ValueError):
+        check_parity(model, compiled, X_holdout)
+
+def test_save_and_load_round_trip(tmp_path):
+    X_train, X_holdout, y_train, _ = make_data(missing=0.1)
+    model = XGBRegressor(n_estimators=20, random_state=42).fit(X_train, y_train)
+    path = tmp_path / 'model.npz'
+    compile_model(model).save(path)
+    check_parity(model, CompiledModel.load(path), X_holdout)
@@ -0,0 +1,46 @@
+# topk.py
+import numpy as np
+
+TOP_K = 50
+TOP_BY = 'total_quantity'
+
+def top_k(values, k, positions=None, tie_keys=None):
+    # Largest k values without sorting everything: argpartition finds the cut-off, then only the
+    # rows at or above it are ordered. Ties go to the smaller tie key, then the earlier row.
+    values = np.asarray(values, dtype='float64')
+    positions = np.arange(len(values)) if positions is None else np.asarray(positions, dtype='int64')
+    if k <= 0 or not len(positions):
+        return positions[:0]
+    scores = np.nan_to_num(values[positions], nan=-np.inf)
+    if k < len(positions):
+        cutoff = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        keep = scores >= cutoff
+        positions, scores = positions[keep], scores[keep]
+    if tie_keys is None:
+        order = np.lexsort((positions, -scores))
+    else:
+        keys = np.asarray(tie_keys)[positions]
+        rank = np.empty(len(keys), dtype='int64')
+        rank[np.argsort(keys, kind='stable')] = np.arange(len(keys))
+        order = np.lexsort((positions, rank, -scores))
+    return positions[order[:k]]
+
+def bucket_top_k(values, margin, edges, k=TOP_K, tie_keys=None):
+    # Top rows per margin bucket [a, b) plus rows sitting exactly on each edge, so any inclusive
+    # range between two edges is covered by merging a few short lists
+    margin = np.asarray(margin, dtype='float64')
+    bucket = np.searchsorted(edges, margin, side='right') - 1
+    valid = ~np.isnan(margin)
+    buckets = [top_k(values, k, np.flatnonzero(valid & (bucket == i)), tie_keys).tolist()
+               for i in range(len(edges) - 1)]
+    on_edge = [top_k(values, k, np.flatnonzero(margin == e), tie_keys).tolist() for e in edges]
+    return {'buckets': buckets, 'on_edge': on_edge}
+
+def merge_bucket_top_k(top, edges, lo, hi):
+    # Candidate rows for lo <= margin <= hi, or None when lo/hi aren't bucket edges
+    if lo not in edges or hi not in edges or lo > hi:
+        return None
+    lo_i, hi_i = edges.index(lo), edges.index(hi)
+    candidates = [row for i in range(lo_i, hi_i) for row in top['buckets'][i]]
+    candidates += top['on_edge'][hi_i]
+    return np.array(candidates, dtype='int64')
@@ -0,0 +1,132 @@
+# tuning.py
+import time
+import numpy as np
+import mlflow
+from sklearn.model_selection import train_test_split, ParameterSampler
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_squared_error
+from xgboost import XGBRegressor
+
+SEARCH_SPACES = {
+    'RandomForest': {
+        'max_depth': [None, 6, 10, 16],
+        'min_samples_leaf': [1, 2, 5, 10],
+        'max_features': [1.0, 0.5, 'sqrt'],
+    },
+    'XGBoost': {
+        'max_depth': [3, 4, 6, 8],
+        'learning_rate': [0.03, 0.1, 0.3],
+        'subsample': [0.7, 0.85, 1.0],
+        'colsample_bytree': [0.7, 1.0],
+        'min_child_weight': [1, 5, 10],
+    },
+}
+
+# n_estimators is the resource that successive halving grows between rungs
+MIN_RESOURCE = 25
+MAX_RESOURCE = 675
+EARLY_STOPPING_ROUNDS = 20
+TUNE_VAL_SIZE = 0.2
+# Share of the budget kept for the k-fold CV that refits every tuned model after the search
+CV_BUDGET_SHARE = 0.25
+
+def build_model(name, params, n_estimators, early_stopping=False, n_jobs=None):
+    if name == 'RandomForest':
+        return RandomForestRegressor(n_estimators=n_estimators, random_state=42, n_jobs=n_jobs, **params)
+    if name == 'XGBoost':
+        extra = {'early_stopping_rounds': EARLY_STOPPING_ROUNDS} if early_stopping else {}
+        return XGBRegressor(n_estimators=n_estimators, random_state=42, n_jobs=n_jobs, **params, **extra)
+    raise ValueError(f"No search space for {name}")
+
+def _fit_trial(name, params, resource, X_train, y_train, X_val, y_val, n_jobs):
+    model = build_model(name, params, resource, early_stopping=(name == 'XGBoost'), n_jobs=n_jobs)
+    if name == 'XGBoost':
+        # Stop adding trees once the validation fold stops improving
+        model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+        n_estimators = model.best_iteration + 1
+        trees_built = model.get_booster().num_boosted_rounds()
+    else:
+        model.fit(X_train, y_train)
+        n_estimators = trees_built = resource
+    rmse = float(np.sqrt(mean_squared_error(y_val, model.predict(X_val))))
+    return rmse, n_estimators, trees_built
+
+def successive_halving(name, X, y, budget_s, n_candidates=27, eta=3, n_jobs=None, random_state=42,
+                       cv_budget_s=None, cv_folds=5, validation=None):
+    # With cv_budget_s, trees are capped so refitting the winner cv_folds times fits in that time;
+    # the trials train on about as many rows as each CV fold does, so their timings carry over.
+    # validation is an (X_val, y_val) pair to score trials on; without it part of X is held out
+    deadline = time.monotonic() + budget_s
+    if validation is None:
+        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=TUNE_VAL_SIZE, random_state=random_state)
+    else:
+        (X_train, y_train), (X_val, y_val) = (X, y), validation
+    configs = list(ParameterSampler(SEARCH_SPACES[name], n_iter=n_candidates, random_state=random_state))
+    resource = MIN_RESOURCE
+    max_trees = MAX_RESOURCE
+    fit_seconds, trees_fitted = 0.0, 0
+    best = None
+    rung = 0
+
+    with mlflow.start_run(run_name=f"{name}-tuning"):
+        mlflow.log_params({"model_name": name, "budget_s": budget_s, "n_candidates": n_candidates, "eta": eta})
+        while configs:
+            scores = []
+            for params in configs:
+                if time.monotonic() >= deadline:
+                    break
+                start = time.perf_counter()
+                rmse, n_estimators, trees_built = _fit_trial(name, params, resource, X_train, y_train,
+                                                             X_val, y_val, n_jobs)
+                seconds = time.perf_counter() - start
+                fit_seconds, trees_fitted = fit_seconds + seconds, trees_fitted + trees_built
+                with mlflow.start_run(run_name=f"{name}-rung{rung}", nested=True):
+                    mlflow.log_params({**params, "model_name": name, "rung": rung, "resource": resource})
+                    mlflow.log_metrics({"val_rmse": rmse, "n_estimators": n_estimators, "fit_seconds": seconds})
+                scores.append((rmse, n_estimators, params))
+            if not scores:
+                break
+
+            # Scores are only comparable within a rung, so the latest finished rung decides
+            scores.sort(key=lambda s: s[0])
+            best = scores[0]
+            print(f"🔎 {name} rung {rung}: {len(scores)} trial(s) at {resource} trees, best val RMSE {best[0]:.2f}")
+            if cv_budget_s is not None and trees_fitted:
+                max_trees = max(1, min(MAX_RESOURCE, int(cv_budget_s / (cv_folds * fit_seconds / trees_fitted))))
+            next_resource = min(resource * eta, max_trees)
+            if len(scores) < len(configs) or len(scores) == 1 or next_resource <= resource:
+                break
+            configs = [params for _, _, params in scores[:max(1, len(scores) // eta)]]
+            resource = next_resource
+            rung += 1
+
+        if best is not None:
+            n_estimators = min(best[1], max_trees)
+            mlflow.log_params({f"best_{k}": v for k, v in best[2].items()})
+            mlflow.log_metrics({"best_val_rmse": best[0], "best_n_estimators": n_estimators})
+
+    if best is None:
+        print(f"⏱️ No {name} trial finished within the budget, keeping defaults")
+        return None
+    if n_estimators < best[1]:
+        print(f"⏱️ Capping {name} at {n_estimators} trees so its {cv_folds}-fold CV fits the budget")
+    # Single-threaded like the default candidates; the CV spreads folds over the workers instead
+    return build_model(name, best[2], n_estimators)
+
+def tune_candidates(X, y, budget_s, n_jobs=None, cv_folds=5, validation=None):
+    # Split the wall-clock budget between models; time left over by one carries to the next.
+    # Part of it is held back for the final CV, which refits each tuned model cv_folds times
+    deadline = time.monotonic() + budget_s * (1 - CV_BUDGET_SHARE)
+    names = list(SEARCH_SPACES)
+    cv_budget_s = budget_s * CV_BUDGET_SHARE / len(names)
+    tuned = {}
+    for i, name in enumerate(names):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        print(f"\n🎛️ Tuning {name} with {remaining:.0f}s left...")
+        model = successive_halving(name, X, y, remaining / (len(names) - i), n_jobs=n_jobs,
+                                   cv_budget_s=cv_budget_s, cv_folds=cv_folds, validation=validation)
+        if model is not None:
+            tuned[name] = model
+    return tuned